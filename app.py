@@ -1,10 +1,24 @@
 # app.py
 import streamlit as st
 import pandas as pd
-import json
+import pyarrow as pa
+import copy
+import html
+import orjson
 import re
+import time
+from collections import OrderedDict
 from gpt_engine import answer_question
 
+# Streaming render cadence (~40 fps) and max buffered chars between renders
+STREAM_FLUSH_SECS = 0.025
+STREAM_FLUSH_CHARS = 8192
+STREAMING_BOX = "<div style='white-space:pre-wrap'>{}</div>"
+
+# Answer cache (shared across sessions): entry lifetime and max entries
+ANSWER_CACHE_TTL = 600
+ANSWER_CACHE_MAX = 100
+
 # ===========================
 # Page Setup
 # ===========================
@@ -24,17 +38,49 @@ defaults = {
     "primary_response": None,
     "last_question": None,
 }
-for key, val in defaults.items():
-    if key not in st.session_state:
-        st.session_state[key] = val
+if not st.session_state.get("_initialized"):
+    st.session_state.update({k: v for k, v in defaults.items() if k not in st.session_state})
+    st.session_state["_initialized"] = True
 
 # ===========================
 # Markdown Escaping
 # ===========================
+# Backslashes are escaped in the same pass as the markdown chars.
+MD_ESCAPE_RE = re.compile(r'([\\*$`_])')
+
 def escape_md(text: str) -> str:
     """Escape markdown special chars so Streamlit won't misformat $ or _ etc."""
-    text = text.replace("\\", "\\\\")
-    return re.sub(r'([*$`_])', r'\\\1', text)
+    return MD_ESCAPE_RE.sub(r'\\\1', text)
+
+# ===========================
+# Answer Cache
+# ===========================
+@st.cache_resource(show_spinner=False)
+def answer_cache() -> OrderedDict:
+    """Process-wide LRU of {key: (stored_at, tokens, result_without_stream)}."""
+    return OrderedDict()
+
+def answer_cache_key(inputs: dict) -> bytes:
+    return orjson.dumps(inputs, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+
+def cached_answer(key: bytes):
+    """Return a replayable result for key, or None on miss/expiry."""
+    cache = answer_cache()
+    hit = cache.get(key)
+    if not hit or time.time() - hit[0] > ANSWER_CACHE_TTL:
+        return None
+    cache.move_to_end(key)
+    result = copy.deepcopy(hit[2])
+    result["stream"] = iter(hit[1])
+    return result
+
+def store_answer(key: bytes, tokens: list, result: dict) -> None:
+    cache = answer_cache()
+    meta = {k: v for k, v in result.items() if k != "stream"}
+    cache[key] = (time.time(), list(tokens), copy.deepcopy(meta))
+    cache.move_to_end(key)
+    while len(cache) > ANSWER_CACHE_MAX:
+        cache.popitem(last=False)
 
 # ===========================
 # Display Chat History
@@ -53,7 +99,9 @@ if question:
     # -----------------------
     # Save user message
     # -----------------------
-    st.session_state.chat_history.append({"role": "user", "content": question})
+    st.session_state.chat_history.append(
+        {"role": "user", "content": question}
+    )
     with st.chat_message("user", avatar="user.png"):
         st.markdown(question)
 
@@ -62,11 +110,12 @@ if question:
     # -----------------------
     with st.chat_message("assistant", avatar="businessman.png"):
         response_container = st.empty()
+        chunks = []
         response_text = ""
 
         try:
             # ✅ Pass full persistent state into gpt_engine
-            result = answer_question(
+            inputs = dict(
                 question=question,
                 last_question=st.session_state.last_question,
                 conversation_summary=st.session_state.conversation_summary,
@@ -74,15 +123,45 @@ if question:
                 resolved_question=st.session_state.resolved_question,
                 primary_response=st.session_state.primary_response,
             )
+            # Identical question + conversation state → replay the cached answer
+            cache_key = answer_cache_key(inputs)
+            result = cached_answer(cache_key)
+            from_cache = result is not None
+            if not from_cache:
+                result = answer_question(**inputs)
 
             # -----------------------
             # Stream response tokens
             # -----------------------
+            # Coalesce tokens and only re-render every STREAM_FLUSH_SECS
+            # (or once STREAM_FLUSH_CHARS have piled up), not per token.
+            # Tokens go into a list; only the new delta is escaped per flush
+            # (escaping is per-char, so escaped pieces concatenate safely).
+            # While streaming we show plain pre-wrapped text and skip Markdown
+            # parsing; the one real Markdown render happens after the stream.
+            escaped = []
+            flushed = 0
+            pending_len = 0
+            last_flush = time.monotonic()
             for token in result["stream"]:
-                response_text += token
-                safe_text = escape_md(response_text)
-                response_container.markdown(safe_text + "▌")
+                chunks.append(token)
+                pending_len += len(token)
+                if (
+                    time.monotonic() - last_flush >= STREAM_FLUSH_SECS
+                    or pending_len >= STREAM_FLUSH_CHARS
+                ):
+                    escaped.append(html.escape("".join(chunks[flushed:])))
+                    flushed = len(chunks)
+                    pending_len = 0
+                    response_container.markdown(
+                        STREAMING_BOX.format("".join(escaped) + "▌"),
+                        unsafe_allow_html=True,
+                    )
+                    last_flush = time.monotonic()
+            response_text = "".join(chunks)
             response_container.markdown(escape_md(response_text))
+            if not from_cache:
+                store_answer(cache_key, chunks, result)
 
             # -----------------------
             # Save assistant response
@@ -110,8 +189,21 @@ if question:
             # Show Data Preview
             # -----------------------
             if result.get("rows"):
-                df = pd.DataFrame(result["rows"], columns=result.get("columns", []))
-                st.dataframe(df, use_container_width=True)
+                columns = result.get("columns", [])
+                table = None
+                if columns and len(set(columns)) == len(columns):
+                    try:
+                        # column-wise straight to Arrow (what st.dataframe ships anyway)
+                        table = pa.Table.from_arrays(
+                            [pa.array(list(col)) for col in zip(*result["rows"])],
+                            names=[str(c) for c in columns],
+                        )
+                    except (pa.ArrowException, ValueError):
+                        table = None  # mixed-type columns or a column/row mismatch
+                if table is None:
+                    # duplicate/missing column names or mixed types: let pandas coerce
+                    table = pd.DataFrame.from_records(result["rows"], columns=columns or None)
+                st.dataframe(table, use_container_width=True)
             else:
                 st.info("No rows returned.")
 
@@ -1,101 +1,178 @@
 # chunk_and_embed.py
-import os, re, time
-from db import get_conn
-from openai import OpenAI
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import os, re, asyncio
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+import psycopg2.extras as extras
+from db import get_conn, get_pool, halfvec_literal
+from openai import AsyncOpenAI
 
 CHARS_PER_CHUNK = 4000
 CHARS_OVERLAP = 600
 MODEL = "text-embedding-3-small"  # 1536 dims
 BATCH_SIZE = 100                  # chunks per API call
-DOCS_PER_SESSION = 200            # reconnect after this many docs
+EMBED_CONCURRENCY = 8             # embedding API calls in flight per flush
+FLUSH_WORKERS = 4                 # flushes (embed + write) running at once
 
-def fetch_missing(limit=None):
+def fetch_missing_iter(conn, limit=None):
+    """
+    Yield docs whose chunks are missing or were cut from an older text
+    (no chunk carries the current text_sha256; only the newest text per
+    readable_id counts), via a server-side cursor, so only `itersize`
+    full texts are held in memory at a time. `conn` must stay open (and
+    not be committed) until the generator is exhausted.
+    """
     sql = """
     SELECT readable_id, workflow_id, text, text_sha256
     FROM ic.contract_texts t
     WHERE NOT EXISTS (
       SELECT 1 FROM ic.contract_chunks c
-      WHERE c.readable_id = t.readable_id
+      WHERE c.readable_id = t.readable_id AND c.text_sha256 = t.text_sha256
+    )
+    AND NOT EXISTS (
+      SELECT 1 FROM ic.contract_texts n
+      WHERE n.readable_id = t.readable_id AND n.updated_at > t.updated_at
     )
     ORDER BY updated_at DESC
     """
     if limit:
         sql += " LIMIT %s"
-    with get_conn() as conn, conn.cursor() as cur:
+    with conn.cursor(name="fetch_missing_ss") as cur:
+        cur.itersize = 50
         cur.execute(sql, (limit,) if limit else None)
-        return cur.fetchall()
+        for row in cur:
+            yield row
 
 def chunk_text(s: str):
     s = (s or "").replace("\x00", "")
     n = len(s)
-    chunks, i = [], 0
-    while i < n:
-        j = min(n, i + CHARS_PER_CHUNK)
-        piece = s[i:j]
-        chunks.append((i, j, piece))
-        if j == n:
-            break
-        i = max(i + CHARS_PER_CHUNK - CHARS_OVERLAP, j)
-    return chunks
-
-def embed_batch(texts):
-    while True:
-        try:
-            resp = client.embeddings.create(model=MODEL, input=texts)
-            return [d.embedding for d in resp.data]
-        except Exception as e:
-            print(f"[warn] embed_batch error {e}, retrying in 10s")
-            time.sleep(10)
+    # Boundaries match the old while-loop, which advanced by
+    # max(i + CHARS_PER_CHUNK - CHARS_OVERLAP, j), i.e. one full chunk.
+    return [(i, min(n, i + CHARS_PER_CHUNK), s[i:i + CHARS_PER_CHUNK])
+            for i in range(0, n, CHARS_PER_CHUNK)]
+
+async def embed_batch_async(aclient, sem, texts):
+    async with sem:
+        while True:
+            try:
+                resp = await aclient.embeddings.create(model=MODEL, input=texts)
+                return [d.embedding for d in resp.data]
+            except Exception as e:
+                print(f"[warn] embed_batch error {e}, retrying in 10s")
+                await asyncio.sleep(10)
 
-def insert_chunks(conn, readable_id, workflow_id, sha, pieces):
+async def embed_batches_async(text_batches):
+    """Embed several batches concurrently (at most EMBED_CONCURRENCY at a time)."""
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+    async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")) as aclient:
+        return await asyncio.gather(
+            *[embed_batch_async(aclient, sem, b) for b in text_batches]
+        )
+
+def insert_chunks(conn, readable_id, workflow_id, sha, pieces, embeddings):
     with conn.cursor() as cur:
         cur.execute("DELETE FROM ic.contract_chunks WHERE readable_id = %s", (readable_id,))
-        for b in range(0, len(pieces), BATCH_SIZE):
-            batch = pieces[b:b+BATCH_SIZE]
-            embeddings = embed_batch([body for _,_,body in batch])
-            for (idx,(start_c,end_c,body)), vec in zip(enumerate(batch, b), embeddings):
-                cur.execute("""
-                  INSERT INTO ic.contract_chunks
-                  (workflow_id, readable_id, chunk_id,
-                   start_char, end_char, chunk_text,
-                   text_sha256, embedding)
-                  VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
-                """, (workflow_id, readable_id, idx,
-                      start_c, end_c, body, sha, vec))
+        values = [
+            (workflow_id, readable_id, idx, start_c, end_c, body, sha, halfvec_literal(vec))
+            for idx, ((start_c, end_c, body), vec) in enumerate(zip(pieces, embeddings))
+        ]
+        extras.execute_values(cur, """
+          INSERT INTO ic.contract_chunks
+          (workflow_id, readable_id, chunk_id,
+           start_char, end_char, chunk_text,
+           text_sha256, embedding)
+          VALUES %s
+        """, values, page_size=500)
         conn.commit()
 
-def main():
-    rows = fetch_missing(limit=None)
-    if not rows:
-        print("No docs need chunking/embedding.")
-        return
+def already_chunked(conn, docs):
+    """readable_ids whose stored chunks already carry the doc's text_sha256."""
+    with conn.cursor() as cur:
+        cur.execute("""
+          SELECT DISTINCT readable_id FROM ic.contract_chunks
+          WHERE (readable_id, text_sha256) IN (SELECT * FROM unnest(%s::text[], %s::text[]))
+        """, ([d[0] for d in docs], [d[2] for d in docs]))
+        return {r[0] for r in cur.fetchall()}
 
-    conn = get_conn()
-    processed = 0
+def flush_docs(conn, docs):
+    """
+    Embed the chunks of several docs together (BATCH_SIZE per API call,
+    regardless of doc boundaries, calls run concurrently), then write each
+    doc's chunks. `docs` is a list of (readable_id, workflow_id, sha, pieces).
+    Docs whose chunks already match their sha (e.g. written by another run
+    since the read cursor's snapshot) are skipped without re-embedding.
+    """
+    done = already_chunked(conn, docs)
+    for readable_id in done:
+        print(f"[skip] {readable_id}: chunks already match text_sha256")
+    docs = [d for d in docs if d[0] not in done]
+    bodies = [body for *_, pieces in docs for _, _, body in pieces]
+    batches = [bodies[b:b+BATCH_SIZE] for b in range(0, len(bodies), BATCH_SIZE)]
+    vecs = [v for batch in asyncio.run(embed_batches_async(batches)) for v in batch]
+    pos = 0
+    for readable_id, workflow_id, sha, pieces in docs:
+        insert_chunks(conn, readable_id, workflow_id, sha, pieces, vecs[pos:pos+len(pieces)])
+        pos += len(pieces)
+        print(f"[ok] {readable_id}: {len(pieces)} chunks embedded & inserted")
 
+def flush_with_pool(pool, docs):
+    """Flush docs on a pooled connection; returns how many docs were in the flush."""
+    conn = pool.getconn()
+    if conn.closed:
+        # server dropped it while idle; swap for a fresh one
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
     try:
-        for i,(readable_id, workflow_id, text, sha) in enumerate(rows, start=1):
-            if not text:
-                print(f"[skip] {readable_id}: no text")
-                continue
-            pieces = chunk_text(text)
-            if not pieces:
-                print(f"[skip] {readable_id}: 0 chunks")
-                continue
-            insert_chunks(conn, readable_id, workflow_id, sha, pieces)
-            processed += 1
-            print(f"[{i}] [ok] {readable_id}: {len(pieces)} chunks embedded & inserted")
-
-            if processed % DOCS_PER_SESSION == 0:
-                # close & reopen connection to avoid Azure timeout
-                conn.close()
-                conn = get_conn()
-                print(f"--- reconnected DB after {processed} docs ---")
-
+        flush_docs(conn, docs)
     finally:
-        conn.close()
+        pool.putconn(conn)
+    return len(docs)
+
+def main():
+    pool = get_pool()
+    processed = 0
+    pending, pending_chunks = [], 0
+    i = 0
+    workers = min(FLUSH_WORKERS, pool.maxconn)
+    futures = set()
+
+    def collect(done):
+        nonlocal processed
+        for fut in done:
+            futures.discard(fut)
+            processed += fut.result()
+            print(f"{processed} docs done")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # dedicated read connection: the server-side cursor lives in its transaction
+        read_conn = get_conn()
+        try:
+            for i,(readable_id, workflow_id, text, sha) in enumerate(fetch_missing_iter(read_conn), start=1):
+                if not text:
+                    print(f"[skip] {readable_id}: no text")
+                    continue
+                pieces = chunk_text(text)
+                if not pieces:
+                    print(f"[skip] {readable_id}: 0 chunks")
+                    continue
+                pending.append((readable_id, workflow_id, sha, pieces))
+                pending_chunks += len(pieces)
+                # fill enough batches to keep every concurrent slot busy
+                if pending_chunks < BATCH_SIZE * EMBED_CONCURRENCY:
+                    continue
+
+                futures.add(executor.submit(flush_with_pool, pool, pending))
+                pending, pending_chunks = [], 0
+                # bound queued flushes so chunk text doesn't pile up in memory
+                if len(futures) >= 2 * workers:
+                    collect(wait(futures, return_when=FIRST_COMPLETED).done)
+        finally:
+            read_conn.close()
+
+        if pending:
+            futures.add(executor.submit(flush_with_pool, pool, pending))
+        collect(as_completed(list(futures)))
+
+    if i == 0:
+        print("No docs need chunking/embedding.")
 
 if __name__ == "__main__":
     main()
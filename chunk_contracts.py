@@ -1,5 +1,6 @@
 # chunk_contracts.py
 import re
+import psycopg2.extras as extras
 from db import get_conn
 
 CHARS_PER_CHUNK = 4000
@@ -23,26 +24,24 @@ def fetch_missing(limit=10):
 def chunk_text(s: str):
     s = s.replace("\x00", "")  # strip any NULs
     n = len(s)
-    i, chunks = 0, []
-    while i < n:
-        j = min(n, i + CHARS_PER_CHUNK)
-        piece = s[i:j]
-        chunks.append((i, j, piece))
-        if j == n:
-            break
-        i = max(i + CHARS_PER_CHUNK - CHARS_OVERLAP, j)
-    return chunks
+    # Boundaries match the old while-loop, which advanced by
+    # max(i + CHARS_PER_CHUNK - CHARS_OVERLAP, j), i.e. one full chunk.
+    return [(i, min(n, i + CHARS_PER_CHUNK), s[i:i + CHARS_PER_CHUNK])
+            for i in range(0, n, CHARS_PER_CHUNK)]
 
 def insert_chunks(readable_id, workflow_id, sha, pieces):
     with get_conn() as conn, conn.cursor() as cur:
         # delete existing chunks for this doc first (safe + idempotent)
         cur.execute("DELETE FROM ic.contract_chunks WHERE readable_id = %s", (readable_id,))
-        for idx, (start_c, end_c, body) in enumerate(pieces):
-            cur.execute("""
-              INSERT INTO ic.contract_chunks
-              (workflow_id, readable_id, chunk_id, start_char, end_char, chunk_text, text_sha256)
-              VALUES (%s,%s,%s,%s,%s,%s,%s)
-            """, (workflow_id, readable_id, idx, start_c, end_c, body, sha))
+        values = [
+            (workflow_id, readable_id, idx, start_c, end_c, body, sha)
+            for idx, (start_c, end_c, body) in enumerate(pieces)
+        ]
+        extras.execute_values(cur, """
+          INSERT INTO ic.contract_chunks
+          (workflow_id, readable_id, chunk_id, start_char, end_char, chunk_text, text_sha256)
+          VALUES %s
+        """, values, page_size=500)
         conn.commit()
 
 def main():
@@ -138,6 +138,10 @@ CREATE TABLE IF NOT EXISTS ic.contract_texts (
 CREATE INDEX IF NOT EXISTS idx_contract_texts_trgm
   ON ic.contract_texts USING gin (text gin_trgm_ops);
 
+-- Fuzzy title lookup (RAG title fallback)
+CREATE INDEX IF NOT EXISTS idx_contract_texts_title_trgm
+  ON ic.contract_texts USING gin (lower(title) gin_trgm_ops);
+
 -- Handy lookup by readable ID
 CREATE INDEX IF NOT EXISTS idx_contract_texts_readable
   ON ic.contract_texts (readable_id);
@@ -146,24 +150,70 @@ CREATE INDEX IF NOT EXISTS idx_contract_texts_readable
 -- === Contract chunks (for semantic search and RAG) ===
 CREATE TABLE IF NOT EXISTS ic.contract_chunks (
   workflow_id   TEXT REFERENCES ic.workflows(workflow_id) ON DELETE CASCADE,
-  chunk_id      BIGSERIAL PRIMARY KEY,
+  readable_id   TEXT NOT NULL,
+  chunk_id      INT NOT NULL,  -- 0..N-1 within the document (no sequence)
   section_hint  TEXT,          -- optional: heading or clause name
   start_page    INT,
   end_page      INT,
   start_char    INT,
   end_char      INT,
   chunk_text    TEXT NOT NULL,
-  embedding     vector(1536),  -- uses pgvector extension (Azure: "vector")
-  text_sha256   TEXT NOT NULL
+  embedding     halfvec(1536), -- pgvector >= 0.7 (Azure: "vector"); FP16 halves storage vs vector
+  text_sha256   TEXT NOT NULL,
+  PRIMARY KEY (readable_id, chunk_id)
 );
 
+-- Migrate older tables keyed on a BIGSERIAL chunk_id to the composite key
+-- (and to INT, which the loaders' binary COPY writes)
+ALTER TABLE ic.contract_chunks ALTER COLUMN chunk_id DROP DEFAULT;
+DROP SEQUENCE IF EXISTS ic.contract_chunks_chunk_id_seq;
+DO $$
+BEGIN
+  IF (SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+      WHERE attrelid = 'ic.contract_chunks'::regclass AND attname = 'chunk_id') = 'bigint' THEN
+    ALTER TABLE ic.contract_chunks ALTER COLUMN chunk_id TYPE INT;
+  END IF;
+  IF (SELECT array_length(conkey, 1) FROM pg_constraint
+      WHERE conrelid = 'ic.contract_chunks'::regclass AND contype = 'p') = 1 THEN
+    ALTER TABLE ic.contract_chunks DROP CONSTRAINT contract_chunks_pkey;
+    ALTER TABLE ic.contract_chunks ADD PRIMARY KEY (readable_id, chunk_id);
+  END IF;
+END $$;
+
 -- Trigram index for fast keyword lookups inside chunks
 CREATE INDEX IF NOT EXISTS idx_contract_chunks_trgm
   ON ic.contract_chunks USING gin (chunk_text gin_trgm_ops);
 
+-- Migrate older vector(1536) embeddings to halfvec(1536) (indexes on the column go first)
+DROP INDEX IF EXISTS ic.idx_contract_chunks_vec;
+DO $$
+BEGIN
+  IF (SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+      WHERE attrelid = 'ic.contract_chunks'::regclass AND attname = 'embedding') <> 'halfvec(1536)' THEN
+    DROP INDEX IF EXISTS ic.idx_contract_chunks_vec_hnsw;
+    ALTER TABLE ic.contract_chunks ALTER COLUMN embedding TYPE halfvec(1536);
+  END IF;
+END $$;
+
 -- Vector index for ANN search (semantic similarity)
-CREATE INDEX IF NOT EXISTS idx_contract_chunks_vec
-  ON ic.contract_chunks USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+-- HNSW: faster and better recall than the old ivfflat index.
+-- Rebuild an index built with older (m, ef_construction) settings.
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_class
+             WHERE oid = to_regclass('ic.idx_contract_chunks_vec_hnsw')
+               AND NOT COALESCE(reloptions, '{}') @> ARRAY['m=24', 'ef_construction=128']) THEN
+    DROP INDEX ic.idx_contract_chunks_vec_hnsw;
+  END IF;
+END $$;
+SET max_parallel_maintenance_workers = 7;  -- parallel HNSW build
+CREATE INDEX IF NOT EXISTS idx_contract_chunks_vec_hnsw
+  ON ic.contract_chunks USING hnsw (embedding halfvec_cosine_ops) WITH (m = 24, ef_construction = 128);
+
+-- Binary-quantized (1 bit/dim) HNSW index: first stage of the two-stage RAG
+-- search, re-ranked by full cosine distance (pgvector >= 0.7)
+CREATE INDEX IF NOT EXISTS idx_contract_chunks_vec_bq
+  ON ic.contract_chunks USING hnsw ((binary_quantize(embedding)::bit(1536)) bit_hamming_ops);
 
 
 -- useful indexes
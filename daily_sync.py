@@ -9,13 +9,16 @@
 # 7) Reconcile transitions for stale active/paused in DB.
 # 8) Update ic.sync_run_log.last_run_at.
 
-import os, re, time, pathlib, hashlib, subprocess
+import io, os, re, time, random, pathlib, hashlib, struct
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Tuple, Set, Optional
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from db import get_conn
+import psycopg2
+import psycopg2.extras as extras
+from db import halfvec_literal, pooled_conn
 from ironclad_auth import get_access_token
 from ironclad_api import (
     list_workflows,
@@ -43,39 +46,70 @@ OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
 BATCH_DB_COMMIT = 25
+EMBED_BATCH = 100       # chunks per embeddings call
+EMBED_WORKERS = 5       # embeddings calls in flight per document
 API_RECONNECT_EVERY = 70
+FETCH_WORKERS = int(os.getenv("DAILY_FETCH_WORKERS", "10"))  # workflows fetched concurrently
+RECORD_WORKERS = 8      # get_record calls in flight across all workflows
 
 # ----- light text + embedding helpers -----
 import pdfplumber
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
 from docx import Document as DocxDocument
 import tiktoken
 from openai import OpenAI
 
 oai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 enc = tiktoken.get_encoding("cl100k_base")
-CTRL_REGEX = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F]')
+# control chars (\x00-\x08, \x0B, \x0C, \x0E-\x1F) -> space, lone CR -> LF
+CTRL_TABLE = {c: 0x20 for c in (*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20))}
+CTRL_TABLE[0x0D] = 0x0A
+SPACES_RE = re.compile(r"[ \t]+")
+BLANK_LINES_RE = re.compile(r"\n{3,}")
 
 def sanitize(s: str) -> str:
     if not s:
         return ""
-    s = CTRL_REGEX.sub(" ", s)
-    s = s.replace("\r\n", "\n").replace("\r", "\n")
-    s = re.sub(r"[ \t]+", " ", s)
-    s = re.sub(r"\n{3,}", "\n\n", s)
+    s = s.replace("\r\n", "\n").translate(CTRL_TABLE)
+    s = SPACES_RE.sub(" ", s)
+    s = BLANK_LINES_RE.sub("\n\n", s)
     return s.strip()
 
+_sha256 = hashlib.sha256  # bound once; no per-call import or attribute lookup
+
 def sha256(text: str) -> str:
-    import hashlib as _h
-    return _h.sha256(text.encode("utf-8")).hexdigest()
+    return _sha256(text.encode("utf-8")).hexdigest()
+
+def _pdf_text(path: pathlib.Path, sep: str) -> str:
+    """
+    Text-only extraction via pdfium when available (much faster than
+    pdfplumber's layout pass); falls back to pdfplumber page by page,
+    dropping each page's layout cache as we go.
+    """
+    if pdfium is not None:
+        try:
+            pdf = pdfium.PdfDocument(str(path))
+            try:
+                return sep.join(pdf[i].get_textpage().get_text_range() for i in range(len(pdf)))
+            finally:
+                pdf.close()
+        except Exception as e:
+            print(f"   ⚠ pdfium failed for {path.name}: {e}; falling back to pdfplumber")
+    buf = io.StringIO()
+    with pdfplumber.open(path) as pdf:
+        for i, p in enumerate(pdf.pages):
+            if i:
+                buf.write(sep)
+            buf.write(p.extract_text() or "")
+            p.flush_cache()
+    return buf.getvalue()
 
 def extract_text_from_path(path: pathlib.Path) -> Tuple[str, str]:
     if path.suffix.lower() == ".pdf":
-        parts = []
-        with pdfplumber.open(path) as pdf:
-            for p in pdf.pages:
-                parts.append(p.extract_text() or "")
-        text = "\n\n".join(parts)
-        return sanitize(text), sanitize(path.stem)
+        return sanitize(_pdf_text(path, "\n\n")), sanitize(path.stem)
     if path.suffix.lower() in (".docx", ".doc"):
         doc = DocxDocument(str(path))
         text = "\n".join(p.text for p in doc.paragraphs)
@@ -90,16 +124,13 @@ CHARS_PER_CHUNK = 4000
 CHARS_OVERLAP = 600
 
 def chunk_text(s: str) -> List[Tuple[int, int, str]]:
-    s = sanitize(s)
+    # callers must pre-sanitize (extract_text_from_path already does)
+    assert "\r" not in s, "chunk_text expects sanitized text"
     n = len(s)
-    chunks, i = [], 0
-    while i < n:
-        j = min(n, i + CHARS_PER_CHUNK)
-        piece = s[i:j]
-        chunks.append((i, j, piece))
-        if j == n: break
-        i = max(i + CHARS_PER_CHUNK - CHARS_OVERLAP, j)
-    return chunks
+    # Same boundaries as the old while-loop: its step max(i + CHARS_PER_CHUNK
+    # - CHARS_OVERLAP, j) always came out to one full chunk.
+    return [(i, min(n, i + CHARS_PER_CHUNK), s[i:i + CHARS_PER_CHUNK])
+            for i in range(0, n, CHARS_PER_CHUNK)]
 
 def embed_batch(texts: List[str]) -> List[List[float]]:
     payload = [t if (t and t.strip()) else " " for t in texts]
@@ -111,79 +142,102 @@ def embed_batch(texts: List[str]) -> List[List[float]]:
             print(f"[warn] embed_batch: {e}; retrying in 8s")
             time.sleep(8)
 
+def _embed_batch_jittered(texts: List[str]) -> List[List[float]]:
+    time.sleep(random.uniform(0, 0.1))  # spread submissions to avoid 429 bursts
+    return embed_batch(texts)
+
+def embed_batches(texts: List[str]) -> List[List[float]]:
+    """Embed in EMBED_BATCH-sized calls, EMBED_WORKERS at a time; order preserved."""
+    batches = [texts[b:b+EMBED_BATCH] for b in range(0, len(texts), EMBED_BATCH)]
+    if len(batches) <= 1:
+        return embed_batch(batches[0]) if batches else []
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as ex:
+        return [v for vecs in ex.map(_embed_batch_jittered, batches) for v in vecs]
+
 # ----- Ironclad doc download -----
 import requests
+from requests.adapters import HTTPAdapter
 BASE_URL = "https://na1.ironcladapp.com"
 
+# One pooled session for all downloads so TLS + keep-alive are reused across
+# workflows; sized for the FETCH_WORKERS threads that call it concurrently.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=max(32, FETCH_WORKERS)))
+
+IRONCLAD_USER_EMAIL = os.getenv("IRONCLAD_USER_EMAIL")
+_headers_cache: Tuple[Optional[str], Dict[str, str]] = (None, {})  # (token, headers)
+
 def _headers():
-    h = {"Authorization": f"Bearer {get_access_token()}", "Accept": "application/json"}
-    if os.getenv("IRONCLAD_USER_EMAIL"):
-        h["x-as-user-email"] = os.getenv("IRONCLAD_USER_EMAIL")
-    return h
+    """Shared header dict, rebuilt only when the (already cached) token rotates. Don't mutate it."""
+    global _headers_cache
+    token = get_access_token()
+    if _headers_cache[0] != token:
+        h = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+        if IRONCLAD_USER_EMAIL:
+            h["x-as-user-email"] = IRONCLAD_USER_EMAIL
+        _headers_cache = (token, h)  # one assignment, so threads never see a mismatched pair
+    return _headers_cache[1]
+
+UNSAFE_FILENAME_RE = re.compile(r'[<>:"/\\|?*]')
 
 def safe_filename(ic_number: str, orig_name: str, source_tag: str) -> str:
-    orig = re.sub(r'[<>:"/\\|?*]', "_", orig_name)
+    orig = UNSAFE_FILENAME_RE.sub("_", orig_name)
     return f"{ic_number}_{source_tag} - {orig[:100]}"
 
-def _coerce_list(x):
-    if not x:
-        return []
-    if isinstance(x, list):
-        return x
-    if isinstance(x, dict):
-        return [x]
-    return []
+# (attribute, default filename); "signed" is a single object, the rest may be lists
+_DOC_SOURCES = (
+    ("signed", "signed.pdf"),
+    ("draft", "draft.pdf"),
+    ("uploadedFiles", None),
+    ("attachments", None),
+    ("files", None),
+    ("documents", None),
+)
 
 def _collect_candidate_docs(attributes: Dict[str, Any]) -> List[Dict[str, str]]:
     """
     Be aggressive: harvest candidates from common attachment places.
-    Each candidate: {"href": str, "filename": str, "ts": str}
+    Each candidate: {"href": str, "filename": str, "ts": str}, unique by href
+    (keeping the latest timestamp), in source order. Use _doc_rank for ordering.
     """
-    cands: List[Dict[str,str]] = []
-
-    # 1) Explicit signed doc
-    signed = attributes.get("signed")
-    if isinstance(signed, dict):
-        href = signed.get("download") or signed.get("href")
-        fn = signed.get("filename") or "signed.pdf"
-        ts = (signed.get("lastModified") or {}).get("timestamp") or ""
-        if href:
-            cands.append({"href": href, "filename": fn, "ts": ts})
-
-    # 2) Drafts: pick the newest
-    for d in _coerce_list(attributes.get("draft")):
-        if isinstance(d, dict):
+    uniq: Dict[str, Dict[str, str]] = {}
+    for key, default_fn in _DOC_SOURCES:
+        val = attributes.get(key)
+        if isinstance(val, dict):
+            items = (val,)
+        elif isinstance(val, list) and key != "signed":
+            items = val
+        else:
+            continue
+        for d in items:
+            if not isinstance(d, dict):
+                continue
             href = d.get("download") or d.get("href")
-            fn = d.get("filename") or "draft.pdf"
-            ts = (d.get("lastModified") or {}).get("timestamp") or ""
-            if href:
-                cands.append({"href": href, "filename": fn, "ts": ts})
-
-    # 3) Other likely places that some environments use
-    for key in ("uploadedFiles", "attachments", "files", "documents"):
-        for d in _coerce_list(attributes.get(key)):
-            if isinstance(d, dict):
-                href = d.get("download") or d.get("href")
-                fn = d.get("filename") or d.get("name") or f"{key}.pdf"
-                ts = (d.get("lastModified") or {}).get("timestamp") or ""
-                if href:
-                    cands.append({"href": href, "filename": fn, "ts": ts})
-
-    # Keep unique by href, and prefer later timestamps
-    uniq = {}
-    for x in cands:
-        href = x["href"]
-        if href not in uniq or str(x.get("ts","")) > str(uniq[href].get("ts","")):
-            uniq[href] = x
-    out = list(uniq.values())
-    # Sort newest first; ensure signed is preferred when ties
-    out.sort(key=lambda z: (str(z.get("ts","")), "signed" not in z.get("filename","").lower()), reverse=True)
-    return out
+            if not href:
+                continue
+            ts = str((d.get("lastModified") or {}).get("timestamp") or "")
+            prev = uniq.get(href)
+            if prev is None or ts > prev["ts"]:
+                fn = d.get("filename") or default_fn or d.get("name") or f"{key}.pdf"
+                uniq[href] = {"href": href, "filename": fn, "ts": ts}
+    return list(uniq.values())
+
+def _doc_rank(c: Dict[str, str]) -> Tuple[str, bool]:
+    # newest first; ties broken the way the previous sort(reverse=True) did
+    return c["ts"], "signed" not in c["filename"].lower()
+
+def _ranked_candidates(cands: List[Dict[str, str]]):
+    """Best candidate first (one linear pass); the rest are only sorted if it fails."""
+    if not cands:
+        return
+    best = max(cands, key=_doc_rank)
+    yield best
+    yield from sorted((c for c in cands if c is not best), key=_doc_rank, reverse=True)
 
 def _download_url_to(readable_id: str, href: str, filename: str, source_tag: str) -> Optional[pathlib.Path]:
     dl = href if href.startswith("http") else f"{BASE_URL}{href}"
     out = OUTPUT_DIR / safe_filename(readable_id, filename, source_tag)
-    with requests.get(dl, headers=_headers(), stream=True, timeout=180) as r:
+    with _SESSION.get(dl, headers=_headers(), stream=True, timeout=180) as r:
         r.raise_for_status()
         with open(out, "wb") as f:
             for chunk in r.iter_content(1024 * 256):
@@ -195,8 +249,7 @@ def download_primary_doc(readable_id: str, attributes: Dict[str, Any], source_ta
     Aggressive downloader: try signed, newest draft, and other attachment buckets.
     Fallback: optional document API if exposed.
     """
-    cands = _collect_candidate_docs(attributes)
-    for c in cands:
+    for c in _ranked_candidates(_collect_candidate_docs(attributes)):
         try:
             return _download_url_to(readable_id, c["href"], c["filename"], source_tag)
         except Exception as e:
@@ -215,10 +268,16 @@ def download_primary_doc(readable_id: str, attributes: Dict[str, Any], source_ta
     return None
 
 # ----- DB text/embeddings upsert -----
-def upsert_text_and_chunks(cur, workflow_id: str, readable_id: str, title_fallback: str, text: str) -> int:
-    cur.execute("SELECT title FROM ic.workflows WHERE readable_id = %s", (readable_id,))
-    row = cur.fetchone()
-    title_to_store = sanitize(row[0]) if row and row[0] else sanitize(title_fallback)
+def upsert_text_and_chunks(cur, workflow_id: str, readable_id: str, title_fallback: str, text: str,
+                           title_map: Optional[Dict[str, Optional[str]]] = None) -> int:
+    # title_map: {readable_id: workflow title} known by the caller; saves the SELECT
+    if title_map is not None and readable_id in title_map:
+        wf_title = title_map[readable_id]
+    else:
+        cur.execute("SELECT title FROM ic.workflows WHERE readable_id = %s", (readable_id,))
+        row = cur.fetchone()
+        wf_title = row[0] if row else None
+    title_to_store = sanitize(wf_title) if wf_title else sanitize(title_fallback)
 
     # Always refresh text for this readable_id
     cur.execute("DELETE FROM ic.contract_chunks WHERE readable_id = %s", (readable_id,))
@@ -228,7 +287,7 @@ def upsert_text_and_chunks(cur, workflow_id: str, readable_id: str, title_fallba
         return 0
 
     text_sha = sha256(text)
-    token_count = len(enc.encode(text))
+    token_count = len(enc.encode_ordinary(text))  # no special-token scan
     cur.execute(
         """
         INSERT INTO ic.contract_texts
@@ -242,21 +301,83 @@ def upsert_text_and_chunks(cur, workflow_id: str, readable_id: str, title_fallba
     if not pieces:
         return 0
 
-    # embed in sub-batches of 100
-    for b in range(0, len(pieces), 100):
-        batch = pieces[b:b+100]
-        vecs = embed_batch([p[2] for p in batch])
-        for idx, ((start_c, end_c, body), vec) in enumerate(zip(batch, vecs), start=b):
-            cur.execute(
-                """
-                INSERT INTO ic.contract_chunks
-                  (workflow_id, readable_id, chunk_id, start_char, end_char, chunk_text, text_sha256, embedding)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
-                """,
-                (workflow_id, readable_id, idx, start_c, end_c, body, sha256(body), vec),
-            )
+    # embed sub-batches concurrently; only the HTTP calls run in threads,
+    # inserts stay on this cursor (psycopg2 connections aren't thread-safe)
+    vecs = embed_batches([p[2] for p in pieces])
+    rows = [
+        (workflow_id, readable_id, idx, start_c, end_c, body, sha256(body), vec)
+        for idx, ((start_c, end_c, body), vec) in enumerate(zip(pieces, vecs))
+    ]
+    insert_chunk_rows(cur, rows)
     return len(pieces)
 
+# ----- bulk chunk insert (COPY BINARY, execute_values fallback) -----
+CHUNK_COLS = "(workflow_id, readable_id, chunk_id, start_char, end_char, chunk_text, text_sha256, embedding)"
+_PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_PGCOPY_TRAILER = struct.pack(">h", -1)
+_copy_binary_ok = True  # flipped off for the run if the server rejects binary halfvec
+_chunk_id_fmt: Optional[str] = None  # struct format of chunk_id, read once from the live table
+
+def _copy_field(buf: io.BytesIO, data: Optional[bytes]) -> None:
+    if data is None:
+        buf.write(struct.pack(">i", -1))
+    else:
+        buf.write(struct.pack(">i", len(data)))
+        buf.write(data)
+
+def _chunk_id_format(cur) -> str:
+    """'>i' for INT chunk_id, '>q' for a table create_schema.py hasn't migrated off BIGINT yet."""
+    global _chunk_id_fmt
+    if _chunk_id_fmt is None:
+        cur.execute("""
+            SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'ic.contract_chunks'::regclass AND attname = 'chunk_id'
+        """)
+        _chunk_id_fmt = ">q" if cur.fetchone()[0] == "bigint" else ">i"
+    return _chunk_id_fmt
+
+def _chunk_rows_to_pgcopy(rows, chunk_id_fmt: str = ">i") -> io.BytesIO:
+    """Encode chunk rows in COPY BINARY format; embeddings as pgvector's halfvec wire format."""
+    buf = io.BytesIO()
+    buf.write(_PGCOPY_HEADER)
+    for wf_id, rid, idx, start_c, end_c, body, body_sha, vec in rows:
+        buf.write(struct.pack(">h", 8))
+        _copy_field(buf, wf_id.encode("utf-8") if wf_id is not None else None)
+        _copy_field(buf, rid.encode("utf-8"))
+        _copy_field(buf, struct.pack(chunk_id_fmt, idx))
+        _copy_field(buf, struct.pack(">i", start_c))
+        _copy_field(buf, struct.pack(">i", end_c))
+        _copy_field(buf, body.encode("utf-8"))
+        _copy_field(buf, body_sha.encode("utf-8"))
+        # halfvec_recv: int16 dim, int16 unused, then dim big-endian float16s
+        _copy_field(buf, struct.pack(f">hh{len(vec)}e", len(vec), 0, *vec))
+    buf.write(_PGCOPY_TRAILER)
+    buf.seek(0)
+    return buf
+
+def insert_chunk_rows(cur, rows) -> None:
+    global _copy_binary_ok
+    if _copy_binary_ok:
+        cur.execute("SAVEPOINT chunk_copy")
+        try:
+            cur.copy_expert(
+                f"COPY ic.contract_chunks {CHUNK_COLS} FROM STDIN WITH (FORMAT BINARY)",
+                _chunk_rows_to_pgcopy(rows, _chunk_id_format(cur)),
+            )
+            cur.execute("RELEASE SAVEPOINT chunk_copy")
+            return
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT chunk_copy")
+            _copy_binary_ok = False
+            print(f"[warn] binary COPY into contract_chunks failed ({e}); using execute_values for this run")
+
+    extras.execute_values(
+        cur,
+        f"INSERT INTO ic.contract_chunks {CHUNK_COLS} VALUES %s",
+        [r[:7] + (halfvec_literal(r[7]),) for r in rows],
+        page_size=200,
+    )
+
 # ----- snapshot helpers -----
 def api_ids_via_generator(status: str) -> Set[str]:
     ids: Set[str] = set()
@@ -279,47 +400,100 @@ def api_ids_via_generator(status: str) -> Set[str]:
     return ids
 
 def db_ids_for_status(status: str) -> Set[str]:
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute("SELECT workflow_id FROM ic.workflows WHERE status = %s", (status,))
-        return {r[0] for r in cur.fetchall()}
+    return db_ids_by_status(status)[status]
+
+def db_ids_by_status(*statuses: str) -> Dict[str, Set[str]]:
+    """{status: workflow_ids} for several statuses in one round-trip."""
+    out: Dict[str, Set[str]] = {s: set() for s in statuses}
+    with pooled_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT workflow_id, status FROM ic.workflows WHERE status = ANY(%s)",
+            (list(statuses),),
+        )
+        for wid, status in cur.fetchall():
+            out[status].add(wid)
+    return out
 
 def set_last_run_now():
-    with get_conn() as conn, conn.cursor() as cur:
+    with pooled_conn() as conn, conn.cursor() as cur:
         cur.execute("UPDATE ic.sync_run_log SET last_run_at = NOW() WHERE name='daily'")
         conn.commit()
 
 # ----- core process -----
-def _ingest_clause_records(cur, stored_wf_id: str, detail: Dict[str, Any]) -> None:
-    for rid in detail.get("recordIds") or []:
+_RECORD_POOL = ThreadPoolExecutor(max_workers=RECORD_WORKERS)
+
+# Network work (API metadata, document download + text extraction) is done
+# up front by fetch_one() on a thread pool; store_one() then does all the
+# DB writes for that workflow on the single shared cursor.
+def _get_record_safely(rid: str):
+    try:
+        return get_record(rid) or {}
+    except Exception as rec_err:
+        return rec_err
+
+def _fetch_clause_records(detail: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    """(record_id, record or the exception that fetching it raised)."""
+    rids = detail.get("recordIds") or []
+    # shared pool caps record calls across all workflow fetch threads;
+    # ironclad_api._get already backs off and retries on 429s/errors
+    return list(zip(rids, _RECORD_POOL.map(_get_record_safely, rids)))
+
+def _ingest_clause_records(cur, stored_wf_id: str, records: List[Tuple[str, Any]]) -> None:
+    for rid, record in records:
         try:
-            record = get_record(rid) or {}
+            if isinstance(record, Exception):
+                raise record
             insert_clauses_from_record(cur, stored_wf_id, record)
-            time.sleep(0.05)
         except Exception as rec_err:
             print(f"   ⚠ record {rid} failed: {rec_err}")
 
-def _ingest_people_and_comments(cur, stored_wf_id: str) -> None:
+def _fetch_people_and_comments(wf_id: str) -> Tuple[List[dict], List[dict], Optional[Exception]]:
+    participants, comments = [], []
+    try:
+        participants = list_workflow_participants_all(wf_id) or []
+        comments = list_workflow_comments_all(wf_id) or []
+    except Exception as e:
+        return participants, comments, e
+    return participants, comments, None
+
+def _ingest_people_and_comments(cur, stored_wf_id: str, participants: List[dict],
+                                comments: List[dict], err: Optional[Exception]) -> None:
     try:
-        participants = list_workflow_participants_all(stored_wf_id) or []
         if participants:
             insert_participants(cur, stored_wf_id, {"participants": participants})
-        comments = list_workflow_comments_all(stored_wf_id) or []
         if comments:
             insert_comments(cur, stored_wf_id, {"comments": comments})
+        if err:
+            raise err
     except Exception as e:
         print(f"   ⚠ participants/comments fetch failed for {stored_wf_id}: {e}")
 
-def _refresh_text(cur, stored_wf_id: str, attributes: Dict[str, Any]) -> None:
-    readable_id = attributes.get("readableId") or stored_wf_id
+def _fetch_text(wf_id: str, attributes: Dict[str, Any], wf_title: Optional[str]) -> Dict[str, Any]:
+    readable_id = attributes.get("readableId") or wf_id
+    out = {"readable_id": readable_id, "wf_title": wf_title, "text": None, "title_guess": None, "error": None}
     path = None
     try:
         path = download_primary_doc(readable_id, attributes, source_tag="workflow")
     except Exception as e:
-        print(f"   ⚠ download attempt failed for {stored_wf_id}: {e}")
+        print(f"   ⚠ download attempt failed for {wf_id}: {e}")
 
     if path and path.exists():
-        text, title_guess = extract_text_from_path(path)
-        n_chunks = upsert_text_and_chunks(cur, stored_wf_id, readable_id, title_guess, text)
+        try:
+            out["text"], out["title_guess"] = extract_text_from_path(path)
+        except Exception as e:
+            out["error"] = e
+    return out
+
+def _refresh_text(cur, stored_wf_id: str, fetched_text: Dict[str, Any]) -> None:
+    readable_id = fetched_text["readable_id"]
+    if fetched_text["error"]:
+        raise fetched_text["error"]
+
+    if fetched_text["text"] is not None:
+        # the workflow row was just upserted with this title, no need to re-read it
+        n_chunks = upsert_text_and_chunks(cur, stored_wf_id, readable_id,
+                                          fetched_text["title_guess"], fetched_text["text"],
+                                          title_map={readable_id: fetched_text["wf_title"]})
         print(f"   ✍ text refreshed for {readable_id} ({n_chunks} chunks)")
     else:
         # We still delete any existing text/chunks to keep “full refresh” semantics honest for active/paused
@@ -327,15 +501,33 @@ def _refresh_text(cur, stored_wf_id: str, attributes: Dict[str, Any]) -> None:
         cur.execute("DELETE FROM ic.contract_texts  WHERE readable_id = %s", (readable_id,))
         print(f"   ⚠ no document available to refresh text for {readable_id}")
 
-def full_reload_one(cur, token: str, workflow_id: str):
+def fetch_one(workflow_id: str) -> Dict[str, Any]:
+    """All API/download work for one workflow; touches no DB state."""
     detail = get_workflow(workflow_id) or {}
+    wf_id = detail.get("id")
+    attributes = detail.get("attributes", {}) or {}
+    return {
+        "detail": detail,
+        "people": _fetch_people_and_comments(wf_id),
+        "records": _fetch_clause_records(detail),
+        "text": _fetch_text(wf_id, attributes, detail.get("title")),
+    }
+
+def _fetch_one_safely(workflow_id: str):
+    try:
+        return fetch_one(workflow_id)
+    except Exception as e:
+        return e
+
+def store_one(cur, fetched: Dict[str, Any]) -> None:
+    detail = fetched["detail"]
     stored_wf_id, attributes = upsert_workflow(cur, {"workflow": detail})
     insert_documents(cur, stored_wf_id, attributes)
     insert_roles(cur, stored_wf_id, {"workflow": detail})
-    _ingest_people_and_comments(cur, stored_wf_id)
-    _ingest_clause_records(cur, stored_wf_id, detail)
+    _ingest_people_and_comments(cur, stored_wf_id, *fetched["people"])
+    _ingest_clause_records(cur, stored_wf_id, fetched["records"])
     backfill_completed_approvals(cur, stored_wf_id)
-    _refresh_text(cur, stored_wf_id, attributes)
+    _refresh_text(cur, stored_wf_id, fetched["text"])
 
 def process_ids_in_batches(title: str, ids: List[str]):
     if not ids:
@@ -343,17 +535,27 @@ def process_ids_in_batches(title: str, ids: List[str]):
         return
     print(f"{title}: {len(ids)} items")
     seen = 0
-    with get_conn() as conn, conn.cursor() as cur:
+    with pooled_conn() as conn, conn.cursor() as cur, ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
         for i in range(0, len(ids), API_RECONNECT_EVERY):
-            token = get_access_token()
             batch = ids[i:i+API_RECONNECT_EVERY]
-            for wid in batch:
+            # Ingest-only and re-run daily, so don't wait on WAL fsync at each
+            # commit (LOCAL: lasts for this batch's transaction only).
+            cur.execute("SET LOCAL synchronous_commit = off")
+            # fetches run ahead in the pool; writes happen here, in id order
+            for wid, fetched in zip(batch, ex.map(_fetch_one_safely, batch)):
+                # a savepoint per workflow: a DB error rolls back just that
+                # workflow instead of aborting the rest of the batch
+                cur.execute("SAVEPOINT wf")
                 try:
-                    full_reload_one(cur, token, wid)
+                    if isinstance(fetched, Exception):
+                        raise fetched
+                    store_one(cur, fetched)
+                    cur.execute("RELEASE SAVEPOINT wf")
                     seen += 1
                     if seen % 10 == 0:
                         print(f"  ✔ {seen}/{len(ids)} processed")
                 except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT wf")
                     print(f"  ❌ {wid}: {e}")
             conn.commit()
             print(f"  💾 committed up to {seen}")
@@ -365,49 +567,51 @@ def main():
     completed_api = api_ids_via_generator("completed")
     print(f"  active_api={len(active_api)} paused_api={len(paused_api)} completed_api={len(completed_api)}")
 
-    print("📊 loading DB status sets…")
-    active_db     = db_ids_for_status("active")
-    paused_db     = db_ids_for_status("paused")
+    # active/paused are refreshed in full, so only the completed set is needed here
+    print("📊 loading DB completed ids…")
     completed_db  = db_ids_for_status("completed")
 
     # COMPLETED → only NEW ids
-    completed_new = sorted(list(completed_api - completed_db))
+    completed_new = sorted(completed_api - completed_db)
 
     # 1) COMPLETED (new only) — full ingest metadata + text
     process_ids_in_batches("🟢 completed (new)", completed_new)
 
     # 2) ACTIVE (ALL) — full refresh metadata + text (delete + re-embed every run)
-    process_ids_in_batches("🟡 active (refresh all)",  sorted(list(active_api)))
+    process_ids_in_batches("🟡 active (refresh all)",  sorted(active_api))
 
     # 3) PAUSED (ALL) — full refresh metadata + text (delete + re-embed every run)
-    process_ids_in_batches("🟠 paused (refresh all)",  sorted(list(paused_api)))
+    process_ids_in_batches("🟠 paused (refresh all)",  sorted(paused_api))
 
     # 4) IMPORTED (NEW/CHANGED) — run your existing import pipeline end-to-end
     print("📦 imported (new/changed): running import sync -> load -> text refresh")
-    try:
-        # fetch latest imported projects/records
-        subprocess.run(["python", "sync_imported.py"], check=False)
-        # upsert into ic.workflows/ic.documents/etc.
-        subprocess.run(["python", "load_imported_workflows.py"], check=False)
-        # extract text + chunk + embed for any new/updated imported files
-        subprocess.run(["python", "sync_contract_texts.py"], check=False)
-    except Exception as e:
-        print(f"  ⚠ imported pipeline error: {e}")
+    # Run in-process (no interpreter start-up / re-imports per step). Like the
+    # old check=False subprocesses, a failing step doesn't stop the next one.
+    import sync_imported, load_imported_workflows, sync_contract_texts
+    steps = (
+        sync_imported,             # fetch latest imported projects/records
+        load_imported_workflows,   # upsert into ic.workflows/ic.documents/etc.
+        sync_contract_texts,       # download files for any new/updated imported records
+    )
+    for step in steps:
+        try:
+            step.main()
+        except Exception as e:
+            print(f"  ⚠ imported pipeline error in {step.__name__}: {e}")
 
     # 4b) Normalize legacy NULL -> 'imported' to keep counts clean
-    with get_conn() as conn, conn.cursor() as cur:
+    with pooled_conn() as conn, conn.cursor() as cur:
         cur.execute("UPDATE ic.workflows SET status = 'imported' WHERE status IS NULL")
         conn.commit()
 
     # 5) Reconcile transitions for actives/paused that disappeared from API sets
-    active_db_after = db_ids_for_status("active")
-    paused_db_after = db_ids_for_status("paused")
-    stale_active = sorted(list(active_db_after - active_api))
-    stale_paused = sorted(list(paused_db_after - paused_api))
+    db_after = db_ids_by_status("active", "paused")
+    stale_active = sorted(db_after["active"] - active_api)
+    stale_paused = sorted(db_after["paused"] - paused_api)
 
     if stale_active or stale_paused:
         print(f"🔄 reconciling transitions… stale_active={len(stale_active)} stale_paused={len(stale_paused)}")
-        with get_conn() as conn, conn.cursor() as cur:
+        with pooled_conn() as conn, conn.cursor() as cur:
             for wid in stale_active + stale_paused:
                 try:
                     wf = get_workflow(wid) or {}
@@ -1,21 +1,60 @@
 import os
+from contextlib import contextmanager
+import numpy as np
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 
 load_dotenv()  # <-- make sure .env values are available
 
-def get_conn():
-    host = os.getenv("PG_HOST")
-    port = int(os.getenv("PG_PORT", "5432"))
-    db   = os.getenv("PG_DB", "postgres")
-    user = os.getenv("PG_USER")
-    pwd  = os.getenv("PG_PASSWORD")
+_pool = None
 
-    return psycopg2.connect(
-        host=host,
-        port=port,
-        dbname=db,
-        user=user,
-        password=pwd,
+def _conn_kwargs():
+    return dict(
+        host=os.getenv("PG_HOST"),
+        port=int(os.getenv("PG_PORT", "5432")),
+        dbname=os.getenv("PG_DB", "postgres"),
+        user=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
         sslmode="require",
+        # TCP keepalives so long-running sessions aren't dropped by Azure
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=5,
     )
+
+def get_conn():
+    return psycopg2.connect(**_conn_kwargs())
+
+def get_pool(minconn: int = 2, maxconn: int = 8) -> ThreadedConnectionPool:
+    """
+    Process-wide pool of keepalive connections. Borrow with getconn(),
+    return with putconn(). Sizes only apply on first call.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ThreadedConnectionPool(minconn, maxconn, **_conn_kwargs())
+    return _pool
+
+def halfvec_literal(vec) -> str:
+    """
+    pgvector text literal rounded to FP16 (5 significant digits round-trip any
+    half). Left uncast so INSERT coerces it to the column type, halfvec or vector.
+    """
+    return "[" + ",".join(f"{x:.5g}" for x in np.asarray(vec, dtype=np.float16).tolist()) + "]"
+
+@contextmanager
+def pooled_conn():
+    """
+    Drop-in for `with get_conn() as conn:` that borrows from get_pool()
+    instead of opening a new SSL connection. Commits on success, rolls back
+    on error, then returns the connection (discarding it if it was closed).
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
@@ -1,23 +1,47 @@
 # extract_and_store_texts.py
-import os, re, hashlib, pathlib
-from typing import Optional, Tuple
+import io, os, re, hashlib, pathlib, functools, itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+import psycopg2.extras as extras
 from db import get_conn
 
 CONTRACT_DIR = pathlib.Path("data/contracts")
 TEST_LIMIT = None      # None = process all files
 BATCH_SIZE = 400       # reconnect every 400 files
 START_INDEX = 1700     # 👈 set this to skip directly to Nth file
+PARSE_WORKERS = os.cpu_count() or 1  # processes parsing PDFs/DOCX in parallel
+PARSE_WINDOW = PARSE_WORKERS * 4     # max files parsed ahead of the inserts (bounds memory)
+INSERT_BATCH = 50                    # parsed texts per execute_values insert + commit
 
 # ---------- text extraction ----------
 
 def extract_text(path: pathlib.Path) -> str:
     ext = path.suffix.lower()
     if ext == ".pdf":
+        try:
+            # text-only pdfium is much faster than pdfplumber's layout pass
+            import pypdfium2 as pdfium
+            pdf = pdfium.PdfDocument(str(path))
+            try:
+                return "\n".join(pdf[i].get_textpage().get_text_range() for i in range(len(pdf)))
+            finally:
+                pdf.close()
+        except ImportError:
+            pass
+        except Exception as e:
+            print(f"[warn] pdfium failed for {path.name}: {e}; falling back to pdfplumber")
         try:
             import pdfplumber
+            # page-by-page into one buffer, dropping each page's layout cache as we go
+            buf = io.StringIO()
             with pdfplumber.open(path) as pdf:
-                parts = [p.extract_text() or "" for p in pdf.pages]
-            return "\n".join(parts)
+                for i, p in enumerate(pdf.pages):
+                    if i:
+                        buf.write("\n")
+                    buf.write(p.extract_text() or "")
+                    p.flush_cache()
+            return buf.getvalue()
         except Exception as e:
             print(f"[error] PDF parse failed for {path.name}: {e}")
             return ""
@@ -32,22 +56,46 @@ def extract_text(path: pathlib.Path) -> str:
     else:
         return ""
 
+CLEAN_TABLE = {0x00: None, 0x0D: 0x0A}  # strip NUL chars, lone CR -> LF
+SPACES_RE = re.compile(r"[ \t]+")
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+
 def clean_text(s: str) -> str:
     if not s:
         return ""
-    s = s.replace("\x00", "")  # strip NUL chars
-    s = s.replace("\r\n", "\n").replace("\r", "\n")
-    s = re.sub(r"[ \t]+", " ", s)
-    s = re.sub(r"\n{3,}", "\n\n", s)
+    s = s.replace("\r\n", "\n").translate(CLEAN_TABLE)
+    s = SPACES_RE.sub(" ", s)
+    s = BLANK_LINES_RE.sub("\n\n", s)
     return s.strip()
 
-def count_tokens(text: str) -> int:
+@functools.lru_cache(maxsize=1)
+def _encoder():
+    """cl100k_base loaded once per process (None if tiktoken is unavailable)."""
     try:
         import tiktoken
-        enc = tiktoken.get_encoding("cl100k_base")
-        return len(enc.encode(text))
+        return tiktoken.get_encoding("cl100k_base")
     except Exception:
+        return None
+
+def count_tokens(text: str) -> int:
+    enc = _encoder()
+    if enc is None:
         return len(text.split())
+    try:
+        # encode_ordinary skips the special-token scan encode() does first
+        return len(enc.encode_ordinary(text))
+    except Exception:
+        return len(text.split())
+
+def parse_one(path_str: str) -> Tuple[str, Optional[str], Optional[int]]:
+    """
+    Worker-side (ProcessPoolExecutor) parse: (clean text, sha256, token count).
+    sha/tokens are None when there is no extractable text. No DB access here.
+    """
+    text = clean_text(extract_text(pathlib.Path(path_str)))
+    if not text:
+        return "", None, None
+    return text, hashlib.sha256(text.encode("utf-8")).hexdigest(), count_tokens(text)
 
 # ---------- filename parsing ----------
 
@@ -66,31 +114,41 @@ def parse_filename(path: pathlib.Path) -> Tuple[str, str, str]:
 
 # ---------- DB helpers ----------
 
-def lookup_workflow(cur, readable_id: str) -> Tuple[Optional[str], Optional[str]]:
-    cur.execute(
-        "SELECT workflow_id, title FROM ic.workflows WHERE readable_id = %s",
-        (readable_id,)
-    )
-    row = cur.fetchone()
-    return (row[0], row[1]) if row else (None, None)
+def load_workflow_map(cur) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """{readable_id: (workflow_id, title)} for every workflow, in one query."""
+    cur.execute("SELECT readable_id, workflow_id, title FROM ic.workflows")
+    return {r[0]: (r[1], r[2]) for r in cur.fetchall()}
 
-def already_loaded(cur, readable_id: str, sha: str) -> bool:
-    cur.execute(
-        "SELECT 1 FROM ic.contract_texts WHERE readable_id = %s AND text_sha256 = %s",
-        (readable_id, sha)
-    )
-    return cur.fetchone() is not None
+def load_text_hashes(cur) -> Set[Tuple[str, str]]:
+    """(readable_id, text_sha256) pairs already in ic.contract_texts."""
+    cur.execute("SELECT readable_id, text_sha256 FROM ic.contract_texts")
+    return {(r[0], r[1]) for r in cur.fetchall()}
 
-def insert_contract_text(cur, workflow_id, readable_id, title, text, sha, token_count, source_status):
-    cur.execute(
+def insert_contract_texts(cur, rows: List[Tuple]) -> None:
+    """rows: (workflow_id, readable_id, title, text, sha, token_count, source_status)."""
+    extras.execute_values(
+        cur,
         """
         INSERT INTO ic.contract_texts
           (workflow_id, readable_id, title, text, text_sha256, token_count, source_status, updated_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+        VALUES %s
         """,
-        (workflow_id, readable_id, title, text, sha, token_count, source_status)
+        rows,
+        template="(%s, %s, %s, %s, %s, %s, %s, NOW())",
+        page_size=INSERT_BATCH,
     )
 
+def parse_in_order(ex: ProcessPoolExecutor, paths: List[pathlib.Path]):
+    """Yield parse_one results in file order, with at most PARSE_WINDOW files in flight."""
+    it = iter(paths)
+    window = deque(ex.submit(parse_one, str(p)) for p in itertools.islice(it, PARSE_WINDOW))
+    while window:
+        res = window.popleft().result()
+        nxt = next(it, None)
+        if nxt is not None:
+            window.append(ex.submit(parse_one, str(nxt)))
+        yield res
+
 # ---------- main ----------
 
 def main():
@@ -108,42 +166,64 @@ def main():
     conn = get_conn()
     cur = conn.cursor()
 
+    # one round-trip each instead of two SELECTs per file
+    wf_map = load_workflow_map(cur)
+    loaded = load_text_hashes(cur)
+
+    # Parsing is CPU-bound, so it runs across processes; results come back in
+    # file order so numbering and dedupe behave exactly as when serial. This
+    # process is the single consumer: parsed texts are inserted INSERT_BATCH
+    # at a time.
+    pending: List[Tuple] = []
+
+    def flush():
+        nonlocal inserted
+        if pending:
+            insert_contract_texts(cur, pending)
+            conn.commit()
+            inserted += len(pending)
+            print(f"--- inserted {len(pending)} texts ---")
+            pending.clear()
+
+    ex = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
     try:
-        for i, path in enumerate(files_to_process, start=START_INDEX+1 if START_INDEX else 1):
+        parsed = parse_in_order(ex, files_to_process)
+        for i, (path, (text, sha, tokens)) in enumerate(zip(files_to_process, parsed),
+                                                        start=START_INDEX+1 if START_INDEX else 1):
             readable_id, source_status, inferred_title = parse_filename(path)
-            wf_id, wf_title = lookup_workflow(cur, readable_id)
+            wf_id, wf_title = wf_map.get(readable_id, (None, None))
             title_to_store = wf_title or inferred_title
 
-            raw = extract_text(path)
-            text = clean_text(raw)
             if not text:
                 print(f"[{i}] [skip] {path.name}: no extractable text")
                 skipped_empty += 1
                 processed += 1
             else:
-                sha = hashlib.sha256(text.encode("utf-8")).hexdigest()
-                if already_loaded(cur, readable_id, sha):
+                if (readable_id, sha) in loaded:
                     print(f"[{i}] [skip] {path.name}: already loaded")
                     processed += 1
                 else:
-                    tokens = count_tokens(text)
-                    insert_contract_text(cur, wf_id, readable_id, title_to_store, text, sha, tokens, source_status)
-                    conn.commit()
-                    inserted += 1
+                    pending.append((wf_id, readable_id, title_to_store, text, sha, tokens, source_status))
+                    loaded.add((readable_id, sha))
                     processed += 1
-                    print(f"[{i}] [ok] {path.name}: inserted (id={readable_id}, wf_id={wf_id}, status={source_status}, tokens={tokens})")
+                    print(f"[{i}] [ok] {path.name}: queued (id={readable_id}, wf_id={wf_id}, status={source_status}, tokens={tokens})")
+                    if len(pending) >= INSERT_BATCH:
+                        flush()
 
             batch_counter += 1
             if batch_counter >= BATCH_SIZE:
                 # reconnect to DB
+                flush()
                 cur.close()
                 conn.close()
                 conn = get_conn()
                 cur = conn.cursor()
                 batch_counter = 0
                 print(f"--- reconnected DB after {i} files ---")
+        flush()
 
     finally:
+        ex.shutdown(cancel_futures=True)
         cur.close()
         conn.close()
 
@@ -1,10 +1,21 @@
-import os, re, json, textwrap
+import copy, json, logging, os, re, textwrap, functools, hashlib, sqlite3, threading, time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from typing import Any, Dict, List, Tuple, Optional
 from decimal import Decimal
 from datetime import datetime, date, timedelta
 
+import httpx
+import numpy as np
+import orjson
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import DefaultHttpxClient, OpenAI
+try:
+    import h2  # noqa: F401 -- present => httpx can negotiate HTTP/2
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
 
 from db import get_conn
 from schema_introspect import get_live_schema
@@ -12,7 +23,20 @@ from schema_reference import SCHEMA_DESCRIPTION
 
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+# One pooled, keep-alive HTTP client for every embeddings/chat call (threads
+# from _llm_pool and Streamlit sessions share it); HTTP/2 multiplexes them
+# over a single TLS connection when h2 is installed.
+client = OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_client=DefaultHttpxClient(
+        http2=_HTTP2,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=30),
+        timeout=httpx.Timeout(60.0, connect=5.0),  # read timeout is per chunk, so streams are fine
+    ),
+)
+_llm_pool = ThreadPoolExecutor(max_workers=8)  # independent chat calls within one turn
 
 # =========================================================
 # Utils
@@ -26,18 +50,36 @@ def safe_json(obj):
     if isinstance(obj, timedelta): return str(obj)
     return obj
 
-def run_sql(sql: str, params: Optional[Tuple[Any,...]]=None, max_rows:int=400):
+def _orjson_default(obj):
+    # the types orjson doesn't handle natively; same conversions as safe_json
+    if isinstance(obj, Decimal): return float(obj)
+    if isinstance(obj, timedelta): return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps_json(obj, option: int = 0) -> str:
+    """Compact UTF-8 JSON text for LLM payloads (orjson; non-str keys allowed).
+    DB rows can go in raw: only the slice that is serialized gets converted."""
+    return orjson.dumps(obj, default=_orjson_default, option=option | orjson.OPT_NON_STR_KEYS).decode()
+
+def run_sql(sql: str, params: Optional[Tuple[Any,...]]=None, max_rows:int=400,
+            ef_search: Optional[int]=None, trgm_threshold: Optional[float]=None):
     with get_conn() as conn:
         with conn.cursor() as cur:
             cur.execute("SET LOCAL statement_timeout = 12000;")
+            if ef_search:
+                # HNSW candidate list for this transaction only
+                cur.execute("SET LOCAL hnsw.ef_search = %s;", (int(ef_search),))
+            if trgm_threshold is not None:
+                # cutoff for the pg_trgm % operator (set_limit), this transaction only
+                cur.execute("SET LOCAL pg_trgm.similarity_threshold = %s;", (float(trgm_threshold),))
             if params is None:
-                print("DEBUG RUN_SQL:", sql)
+                log.debug("RUN_SQL: %s", sql)
                 cur.execute(sql)
             else:
                 cur.execute(sql, params)
             cols = [d[0] for d in cur.description]
             rows = cur.fetchmany(max_rows)
-            print("DEBUG ROWS:", rows)
+            log.debug("ROWS: %s", rows)
             return cols, rows
 
 # =========================================================
@@ -45,22 +87,163 @@ def run_sql(sql: str, params: Optional[Tuple[Any,...]]=None, max_rows:int=400):
 # =========================================================
 EMBED_MODEL = os.getenv("EMBED_MODEL","text-embedding-3-small")
 
+# Two-tier cache for query embeddings: in-process LRU, then a SQLite file that
+# survives restarts. Keys hash (model, text) so a model switch never collides.
+EMBED_CACHE_MAX = 10_000                                                     # LRU entries (~6 KB each)
+EMBED_CACHE_TTL = 86400                                                      # seconds, SQLite tier
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "data/embed_cache.sqlite3")  # "" disables the disk tier
+
+_embed_lru: "OrderedDict[bytes, bytes]" = OrderedDict()
+_embed_lock = threading.Lock()
+_embed_db = None
+
+def _embed_store():
+    """Lazily open the SQLite tier; None if disabled or unavailable."""
+    global _embed_db, EMBED_CACHE_PATH
+    if _embed_db is None and EMBED_CACHE_PATH:
+        try:
+            os.makedirs(os.path.dirname(EMBED_CACHE_PATH) or ".", exist_ok=True)
+            _embed_db = sqlite3.connect(EMBED_CACHE_PATH, check_same_thread=False)
+            _embed_db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vec BLOB, created REAL)"
+            )
+        except sqlite3.Error as e:
+            log.warning("embedding cache disabled: %s", e)
+            EMBED_CACHE_PATH = ""
+            _embed_db = None
+    return _embed_db
+
+EMBED_MAX_INPUTS = 2048  # OpenAI per-request input limit
+
+def _embed_uncached(texts: List[str]) -> List[List[float]]:
+    """One embeddings request per EMBED_MAX_INPUTS texts, results in input order."""
+    vecs: List[List[float]] = []
+    for i in range(0, len(texts), EMBED_MAX_INPUTS):
+        out = client.embeddings.create(model=EMBED_MODEL, input=texts[i:i + EMBED_MAX_INPUTS])
+        vecs.extend(d.embedding for d in sorted(out.data, key=lambda d: d.index))
+    return vecs
+
+_EMBED_KEY_WS_RE = re.compile(r"\s+")
+
+def _embed_cache_text(text: str) -> str:
+    """
+    Normalize for the cache key only: case, runs of whitespace and trailing
+    ?/./! don't change what a retrieval query means, so "List them." and
+    "list them" share one entry.
+    """
+    return _EMBED_KEY_WS_RE.sub(" ", text).strip().rstrip("?.! ").casefold()
+
+def _embed_cache_key(text: str) -> bytes:
+    return hashlib.sha256((EMBED_MODEL + "\0" + _embed_cache_text(text)).encode("utf-8")).digest()
+
+def _embed_cache_get(key: bytes) -> Optional[bytes]:
+    # caller holds _embed_lock
+    blob = _embed_lru.get(key)
+    if blob is not None:
+        _embed_lru.move_to_end(key)
+        return blob
+    db = _embed_store()
+    if db is not None:
+        row = db.execute(
+            "SELECT vec FROM embeddings WHERE key = ? AND created > ?",
+            (key, time.time() - EMBED_CACHE_TTL),
+        ).fetchone()
+        if row:
+            _embed_lru[key] = row[0]
+            return row[0]
+    return None
+
+def _embed_cache_put(items: List[Tuple[bytes, bytes]]) -> None:
+    # caller holds _embed_lock
+    for key, blob in items:
+        _embed_lru[key] = blob
+        _embed_lru.move_to_end(key)
+    while len(_embed_lru) > EMBED_CACHE_MAX:
+        _embed_lru.popitem(last=False)
+    db = _embed_store()
+    if db is not None:
+        now = time.time()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [(key, blob, now) for key, blob in items],
+            )
+
+def embed_queries(texts: List[str]) -> List[List[float]]:
+    """
+    Embed many texts in order. Cached ones are served locally; the rest go
+    out in as few requests as possible (one per EMBED_MAX_INPUTS).
+    """
+    keys = [_embed_cache_key(t) for t in texts]
+    out: List[Optional[List[float]]] = [None] * len(texts)
+    todo: Dict[bytes, List[int]] = {}  # uncached key -> positions (dupes embedded once)
+    with _embed_lock:
+        for pos, key in enumerate(keys):
+            blob = _embed_cache_get(key)
+            if blob is not None:
+                out[pos] = array("f", blob).tolist()
+            else:
+                todo.setdefault(key, []).append(pos)
+    if todo:
+        vecs = _embed_uncached([texts[positions[0]] for positions in todo.values()])
+        for positions, vec in zip(todo.values(), vecs):
+            for pos in positions:
+                out[pos] = vec
+        with _embed_lock:
+            _embed_cache_put([(key, array("f", vec).tobytes()) for key, vec in zip(todo, vecs)])
+    return out
+
 def embed_query(text:str)->List[float]:
-    out = client.embeddings.create(model=EMBED_MODEL,input=text)
-    return out.data[0].embedding
+    return embed_queries([text])[0]
+
+# hnsw.ef_search for RAG searches: pgvector's default (40) is no larger than
+# the LIMIT 40 corpus search, which costs recall.
+RAG_EF_SEARCH = 100
+# Corpus search is two-stage: this many nearest by Hamming distance on the
+# binary-quantized index, then re-ranked by full cosine distance.
+RAG_BQ_CANDIDATES = 500
+
+@functools.lru_cache(maxsize=4)
+def _vector_format(dim: int) -> str:
+    return "[" + ",".join(["%.6f"] * dim) + "]"
 
 def vector_literal(vec: List[float]) -> str:
     # Return ONLY the bracketed vector. Psycopg2 will add the single quotes;
-    # the SQL itself will add the ::vector cast.
-    return "[" + ",".join(f"{x:.6f}" for x in vec) + "]"
+    # the SQL itself will add the ::halfvec cast.
+    # One %-format over a per-dimension template: the float loop stays in C.
+    return _vector_format(len(vec)) % tuple(vec)
+
+@functools.lru_cache(maxsize=256)
+def query_vector_literal(text: str) -> str:
+    """vector_literal(embed_query(text)), memoized so follow-ups on the same
+    resolved question reuse the exact string instead of re-formatting it."""
+    return vector_literal(embed_query(text))
 
 
 # =========================================================
 # SQL generation & validation
 # =========================================================
+LIVE_SCHEMA_TTL = 300  # seconds between information_schema re-reads
+
+_live_schema_cache: Tuple[float, Optional[str]] = (0.0, None)  # (fetched_at, live_json)
+
+def _live_schema_json() -> str:
+    """get_live_schema() rendered as JSON, re-read at most every LIVE_SCHEMA_TTL."""
+    global _live_schema_cache
+    fetched_at, live_json = _live_schema_cache
+    if live_json is None or time.time() - fetched_at > LIVE_SCHEMA_TTL:
+        live_json = dumps_json(get_live_schema(), orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+        _live_schema_cache = (time.time(), live_json)
+    return live_json
+
 def build_sql_system_prompt(weekly_allowed: bool) -> str:
-    live = get_live_schema()
-    live_json = json.dumps(live, indent=2, sort_keys=True)
+    return _render_sql_system_prompt(weekly_allowed, _live_schema_json())
+
+_SCHEMA_DESC = SCHEMA_DESCRIPTION.strip()  # static curated schema, stripped once
+
+@functools.lru_cache(maxsize=4)
+def _render_sql_system_prompt(weekly_allowed: bool, live_json: str) -> str:
+    # keyed on the schema JSON itself, so a schema change renders a fresh prompt
 
     weekly_switch = (
         "WEEKLY_ALLOWED=TRUE\n"
@@ -111,20 +294,30 @@ SELECT ...
     return f"""{rules}
 
 === Curated Schema Description ===
-{SCHEMA_DESCRIPTION.strip()}
+{_SCHEMA_DESC}
 
 === Live Schema ===
 {live_json}
 """
 
 SQL_FENCE_RE = re.compile(r"```sql\s*(.*?)```", re.IGNORECASE|re.DOTALL)
-PROHIBITED = re.compile(
-    r"^\s*(INSERT|UPDATE|DELETE|DROP|ALTER|TRUNCATE|GRANT|REVOKE|MERGE|VACUUM|COPY|SET|SHOW)\b",
-    re.IGNORECASE
-)
+SQL_FENCE_OPEN_RE = re.compile(r"```sql", re.IGNORECASE)
+# Literals, quoted identifiers and comments are matched whole so that only
+# the captured group hits a real statement separator.
+SQL_SEMICOLON_RE = re.compile(r"'[^']*'|\"[^\"]*\"|--[^\n]*|/\*.*?\*/|(;)", re.DOTALL)
+SQL_LEAD_RE = re.compile(r"(?:\s+|--[^\n]*|/\*.*?\*/)*(\w+|\()?", re.DOTALL)
+ALLOWED_LEADS = frozenset({"SELECT", "WITH", "("})
+SELECT_RE = re.compile(r"\bselect\b", re.IGNORECASE)
 
 
+@functools.lru_cache(maxsize=256)
 def extract_sql(text:str)->str:
+    # fast path: the model almost always opens with the fence
+    t = (text or "").lstrip()
+    if t.startswith("```sql"):
+        end = t.find("```", 6)
+        if end != -1:
+            return t[6:end].strip().rstrip(";")
     m = SQL_FENCE_RE.search(text or "")
     return m.group(1).strip().rstrip(";") if m else (text or "").strip().rstrip(";")
 
@@ -133,24 +326,103 @@ def validate_sql_safe(sql: str) -> None:
     Validate that only safe read-only statements are produced.
     Allows multiple SELECT statements separated by semicolons.
     """
-    body = sql.strip()
-    # remove trailing semicolon
-    if body.endswith(";"):
-        body = body[:-1].strip()
-    # still forbid any non-SELECT verbs
-    if PROHIBITED.search(body):
-        raise ValueError("Only SELECT statements are allowed.")
-    # ensure at least one SELECT
-    if not re.search(r"\bselect\b", body, re.IGNORECASE):
+    # One pass over the text: every statement must lead with an allowed token.
+    statements = 0
+    start = 0
+    for m in SQL_SEMICOLON_RE.finditer(sql + "\n;"):  # newline ends a trailing -- comment
+        if m.group(1) is None:
+            continue
+        lead = SQL_LEAD_RE.match(sql, start, m.start()).group(1)
+        start = m.end()
+        if lead is None:
+            continue  # empty statement (e.g. trailing semicolon)
+        if lead.upper() not in ALLOWED_LEADS:
+            raise ValueError("Only SELECT statements are allowed.")
+        statements += 1
+    if not statements:
         raise ValueError("Must contain at least one SELECT statement.")
 
+# Output caps for SQL generation: a single SELECT is short; weekly bundles
+# (sections 1–11) need room.
+SQL_MAX_TOKENS = 600
+WEEKLY_SQL_MAX_TOKENS = 4000
+
+# ask_for_sql response cache. temperature=0 is near- but not strictly
+# deterministic across model updates, so both tiers can be switched off.
+SQL_CACHE_ENABLED = os.getenv("SQL_CACHE", "1") != "0"
+SQL_CACHE_MAX = 512
+SQL_SEMANTIC_MIN_SIM = float(os.getenv("SQL_SEMANTIC_MIN_SIM", "0"))  # e.g. 0.95; 0 = exact tier only
+
+_sql_cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()  # (sys_prompt, q) -> sql
+_sql_semantic: List[Tuple[str, np.ndarray, str]] = []            # (sys_prompt, unit q_emb, sql)
+_sql_cache_lock = threading.Lock()
+
+def _sql_semantic_lookup(sys: str, q_emb: np.ndarray) -> Optional[str]:
+    # caller holds _sql_cache_lock; same prompt means same weekly flag and schema
+    cands = [e for e in _sql_semantic if e[0] is sys or e[0] == sys]
+    if not cands:
+        return None
+    sims = np.stack([e[1] for e in cands]) @ q_emb
+    best = int(sims.argmax())
+    return cands[best][2] if sims[best] >= SQL_SEMANTIC_MIN_SIM else None
+
 def ask_for_sql(q: str, weekly_allowed: bool) -> str:
     sys = build_sql_system_prompt(weekly_allowed)
-    resp = client.chat.completions.create(
+    max_tokens = WEEKLY_SQL_MAX_TOKENS if weekly_allowed else SQL_MAX_TOKENS
+    if not SQL_CACHE_ENABLED:
+        return _ask_for_sql_uncached(sys, q, max_tokens)
+
+    key = (sys, q)
+    q_emb = None
+    with _sql_cache_lock:
+        sql = _sql_cache.get(key)
+        if sql is not None:
+            _sql_cache.move_to_end(key)
+            return sql
+    if SQL_SEMANTIC_MIN_SIM > 0:
+        q_emb = np.asarray(embed_query(q), dtype=np.float32)
+        q_emb /= np.linalg.norm(q_emb) or 1.0
+        with _sql_cache_lock:
+            sql = _sql_semantic_lookup(sys, q_emb)
+        if sql is not None:
+            return sql
+
+    sql = _ask_for_sql_uncached(sys, q, max_tokens)
+    with _sql_cache_lock:
+        _sql_cache[key] = sql
+        while len(_sql_cache) > SQL_CACHE_MAX:
+            _sql_cache.popitem(last=False)
+        if q_emb is not None:
+            _sql_semantic.append((sys, q_emb, sql))
+            del _sql_semantic[:-SQL_CACHE_MAX]
+    return sql
+
+def _ask_for_sql_uncached(sys: str, q: str, max_tokens: int) -> str:
+    # Streamed so we can stop reading as soon as the ```sql fence closes
+    # instead of waiting on any trailing tokens.
+    stream = client.chat.completions.create(
         model="gpt-4o-mini", temperature=0,
-        messages=[{"role": "system", "content": sys}, {"role": "user", "content": q}]
+        messages=[{"role": "system", "content": sys}, {"role": "user", "content": q}],
+        max_tokens=max_tokens,
+        stream=True,
     )
-    return extract_sql(resp.choices[0].message.content or "")
+    text = ""
+    fence_at = -1  # offset just past the opening ```sql, once seen
+    try:
+        for chunk in stream:
+            if not (chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content):
+                continue
+            start = max(0, len(text) - 6)  # a fence can straddle two deltas
+            text += chunk.choices[0].delta.content
+            if fence_at < 0:
+                m = SQL_FENCE_OPEN_RE.search(text, start)
+                if m:
+                    fence_at = m.end()
+            if fence_at >= 0 and text.find("```", max(fence_at, start)) >= 0:
+                break
+    finally:
+        stream.close()
+    return extract_sql(text)
 
 # =========================================================
 # Summarizers (Exec Brief default) + Contract summary
@@ -241,48 +513,79 @@ def build_contract_summarizer_prompt() -> str:
     )
 
 
-def stream_contract_summary_from_text(payload: Dict[str, Any]):
+# System prompts are fixed text, so build them once at import.
+SUMMARIZER_SYS = build_summarizer_prompt()
+GENERAL_SYS = build_general_summarizer_prompt()
+CONTRACT_SYS = build_contract_summarizer_prompt()
+
+# RAG answer prompts. Kept byte-identical across calls (the contract id goes
+# in the payload, not here) so the provider's prompt-prefix cache can reuse them.
+RAG_SINGLE_SYS = (
+    "You are a legal contracts analyst. Your primary source is the provided text "
+    "chunks of the contract given as readable_id in the payload. Cite exact phrases "
+    "using (IC-#### #chunk_id) whenever possible.\n\n"
+
+    "RULES:\n"
+    "1. Always ground factual details (definitions, obligations, clauses) ONLY in the provided text.\n"
+    "2. If the user's question asks for evaluation, comparison, risk assessment, typicality, "
+    "industry standards, or interpretation that is NOT explicitly stated in the text:\n"
+    "      • You MAY use your general legal and commercial knowledge.\n"
+    "      • Make it clear when the text does NOT state something directly.\n"
+    "      • Provide a reasoned, professional opinion based on common contract practices.\n"
+    "3. Never fabricate contract-specific facts that are not in the text.\n"
+)
+RAG_MULTI_SYS = (
+    "You are a legal contracts analyst. Synthesize insights from multiple retrieved contracts.\n"
+    "Use the text as primary evidence but you MAY use general legal knowledge when the user asks for:\n"
+    "   • comparisons\n"
+    "   • risk assessments\n"
+    "   • industry-standard evaluations\n"
+    "   • typicality/market-norm commentary\n"
+    "Cite text when relevant. Do NOT fabricate contract-specific facts.\n"
+)
+
+def _stream_with_system(sys_prompt: str, payload: Dict[str, Any]):
+    """Stream a gpt-4o-mini answer to a JSON payload (compact JSON: fewer tokens)."""
+    # Sent now rather than on the first next(), so the request is already in
+    # flight while answer_question finishes and the caller starts rendering.
     stream = client.chat.completions.create(
         model="gpt-4o-mini",
         temperature=0,
         messages=[
-            {"role": "system", "content": build_contract_summarizer_prompt()},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+            {"role": "system", "content": sys_prompt},
+            {"role": "user", "content": dumps_json(payload)},
         ],
         stream=True,
     )
-    for chunk in stream:
-        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-            yield chunk.choices[0].delta.content
+    return _iter_deltas(stream)
+
+def _iter_deltas(stream):
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.close()  # hand the connection back to the pool even if abandoned early
+
+def stream_contract_summary_from_text(payload: Dict[str, Any]):
+    return _stream_with_system(CONTRACT_SYS, payload)
 
 def stream_summary_from_payload(payload:Dict[str,Any]):
-    stream=client.chat.completions.create(
-        model="gpt-4o-mini",temperature=0,
-        messages=[
-            {"role":"system","content":build_summarizer_prompt()},
-            {"role":"user","content":json.dumps(payload,ensure_ascii=False)},
-        ],stream=True
-    )
-    for chunk in stream:
-        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-            yield chunk.choices[0].delta.content
+    return _stream_with_system(SUMMARIZER_SYS, payload)
 
 def stream_general_from_payload(payload: Dict[str, Any]):
-    stream = client.chat.completions.create(
-        model="gpt-4o-mini", temperature=0,
-        messages=[
-            {"role": "system", "content": build_general_summarizer_prompt()},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-        ],
-        stream=True,
-    )
-    for chunk in stream:
-        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-            yield chunk.choices[0].delta.content
+    return _stream_with_system(GENERAL_SYS, payload)
 
 # =========================================================
 # Multi-turn Memory: History Selector + Follow-up Rewriter
 # =========================================================
+# Native JSON mode: the API guarantees a parseable object, so the prompts
+# only describe the shape. The except-branches below remain as a guard for
+# truncated (max-token) replies.
+JSON_MODE = {"type": "json_object"}
+HISTORY_SELECTOR_MAX_TOKENS = 400  # summary + a handful of history lines
+REWRITER_MAX_TOKENS = 400          # resolved question + scope updates
+
 HISTORY_SELECTOR_PROMPT = """
 You compress conversation context for a contracts analytics bot.
 
@@ -298,7 +601,7 @@ TASK:
 - Update the 1–2 sentence 'updated_summary' to reflect the latest state.
 - Never invent values. If something is unknown, omit it.
 
-OUTPUT STRICT JSON:
+OUTPUT JSON:
 {
   "relevant_history": [ "executed this quarter", "status=completed", "vendor=Lonza" ],
   "updated_summary": "Asked executed this quarter (77). Then breakdown by department."
@@ -377,7 +680,7 @@ This rule ALWAYS applies before any other follow-up rules.
       user_text: "and how many of those were MSAs?"
       resolved_question: "How many MSA contracts were completed this quarter?"
 
-OUTPUT STRICT JSON ONLY:
+OUTPUT JSON:
 {
   "is_followup": true|false,
   "resolved_question": "fully self-contained question string",
@@ -402,12 +705,14 @@ def history_selector(prior_summary: Optional[str],
         model="gpt-4o-mini", temperature=0,
         messages=[
             {"role":"system","content":HISTORY_SELECTOR_PROMPT},
-            {"role":"user","content":json.dumps(payload, ensure_ascii=False)}
-        ]
+            {"role":"user","content":dumps_json(payload)}
+        ],
+        response_format=JSON_MODE,
+        max_tokens=HISTORY_SELECTOR_MAX_TOKENS,
     )
     txt = resp.choices[0].message.content or "{}"
     try:
-        js = json.loads(txt)
+        js = orjson.loads(txt)
         if not isinstance(js.get("relevant_history", []), list):
             js["relevant_history"] = []
         js["updated_summary"] = js.get("updated_summary") or prior_summary
@@ -429,15 +734,19 @@ def followup_rewriter(user_text: str,
         model="gpt-4o-mini", temperature=0,
         messages=[
             {"role":"system","content":REWRITER_PROMPT},
-            {"role":"user","content":json.dumps(payload, ensure_ascii=False)}
-        ]
+            {"role":"user","content":dumps_json(payload)}
+        ],
+        response_format=JSON_MODE,
+        max_tokens=REWRITER_MAX_TOKENS,
     )
     txt = resp.choices[0].message.content or "{}"
-    print("DEBUG RAW REWRITER OUTPUT:", txt)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("rewriter raw=%s", txt)
 
     try:
-        js = json.loads(txt)
-        print("DEBUG PARSED REWRITER JSON:", js)
+        js = orjson.loads(txt)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("rewriter parsed=%s", js)
 
     except Exception:
         js = {
@@ -460,273 +769,181 @@ def followup_rewriter(user_text: str,
 # =========================================================
 # Legacy follow-up detector (kept for safety; used only when needed)
 # =========================================================
-FOLLOWUP_DETECT_PROMPT = """
-You are a classifier that determines if a user's new question is a follow-up to their last question in a conversation.
-You must respond ONLY with JSON in the format: {"followup": true} or {"followup": false}
+FOLLOWUP_PROMPT = """
+You decide whether a user's new question (Now) is a follow-up to their last question (Last) in a conversation,
+and if so rewrite them into ONE clear standalone question that does not rely on prior context.
+You must respond ONLY with JSON in the format: {"followup": true|false, "merged": "<question>"}
 
-Rules:
+Follow-up rules:
 - A follow-up = ONLY if the new question is incomplete or ambiguous without the previous one.
-- If uncertain, return {"followup": false}.
-"""
-FOLLOWUP_MERGE_PROMPT = """
-You are a question rewriter. Given the previous user question (Last) and the current follow-up (Now),
-rewrite them into ONE clear standalone question that does not rely on prior context.
+- If uncertain, it is NOT a follow-up.
+- When followup is false, "merged" must be the Now question unchanged.
 
-CRITICAL:
+Rewrite rules (when followup is true):
 - Preserve the TASK TYPE from the Now message.
 - Keep all important filters from Last and Now.
 - Do NOT invent new information.
-- Output ONLY the rewritten question as plain text (no explanations).
 """
+FOLLOWUP_MAX_TOKENS = 200  # {"followup": ..., "merged": "<one question>"}
 
-def is_followup(last_q: str, current_q: str) -> bool:
-    if not last_q or not current_q: 
-        return False
+@functools.lru_cache(maxsize=256)
+def _classify_and_merge(last_q: str, current_q: str) -> Tuple[bool, str]:
+    """One round-trip for both legacy decisions; memoized so the pair costs one call."""
     msgs = [
-        {"role":"system","content":FOLLOWUP_DETECT_PROMPT},
+        {"role":"system","content":FOLLOWUP_PROMPT},
         {"role":"user","content":f"Last: {last_q}\nNow: {current_q}"}
     ]
-    resp = client.chat.completions.create(model="gpt-4o-mini", temperature=0, messages=msgs)
+    resp = client.chat.completions.create(model="gpt-4o-mini", temperature=0, messages=msgs,
+                                          max_tokens=FOLLOWUP_MAX_TOKENS)
     content = (resp.choices[0].message.content or "{}").strip()
-
     try:
-        js = json.loads(content)
-        return bool(js.get("followup", False))
+        js = orjson.loads(_extract_first_json(content))
     except Exception:
+        return False, current_q
+    merged = js.get("merged")
+    merged = merged.strip() if isinstance(merged, str) else ""
+    return bool(js.get("followup", False)), merged or current_q
+
+def is_followup(last_q: str, current_q: str) -> bool:
+    if not last_q or not current_q: 
         return False
+    return _classify_and_merge(last_q, current_q)[0]
 
 def merge_followup(last_q: str, current_q: str) -> str:
-    msgs = [
-        {"role":"system","content":FOLLOWUP_MERGE_PROMPT},
-        {"role":"user","content":f"Last: {last_q}\nNow: {current_q}"}
-    ]
-    resp = client.chat.completions.create(model="gpt-4o-mini", temperature=0, messages=msgs)
-    merged = (resp.choices[0].message.content or current_q).strip()
-    return merged if merged else current_q
+    return _classify_and_merge(last_q, current_q)[1]
 
 # =========================================================
 # Intent classification
 # =========================================================
 IC_ID_RE = re.compile(r"\bIC-\d+\b", re.IGNORECASE)
+IC_ID_FULL_RE = re.compile(r"IC-\d+", re.IGNORECASE)  # used with fullmatch
+QUOTED_TERM_RE = re.compile(r"['\"]([^'\"]+)['\"]")
 
 INTENT_SYSTEM_PROMPT = """
-You are an intent classifier for a legal contracts assistant. Your job is to classify the user's request into one of the supported query types below.
-
-Always return STRICT JSON in this format:
-{
-  "intent": "text_mention_count | text_snippets | summarize_contract | compare_contracts | semantic_find | similar_to_contract | weekly_report | sql_generic | rag_text_qa",
-  "terms": [string],                     # any keywords to match on (if applicable)
-  "logic": {"operator":"AND|OR","exclude":[string]},
-  "near": {"enabled":true|false,"window":120},
-  "readable_ids":[string],              # like IC-1234
-  "query_text":string|null,
-  "vendor_term":string|null,
-  "notes":string|null
-}
-
-CRITICAL NON-NEGOTIABLE RULE:
-- "query_text" MUST be an EXACT character-for-character copy of the user's original question.
-- NEVER rewrite, rephrase, expand, shorten, or modify the user's question in any way.
-- NEVER add generic words like "contract", "agreement", "document", "clause", etc.
-- NEVER add vendor names, entity names, IC IDs, or inferred attributes unless the user explicitly typed them.
-- The assistant MUST preserve the original user wording exactly.
-
----
-
-## INTENT DEFINITIONS AND EXAMPLES:
-
-### 🔹 text_mention_count  
-Count how many contracts contain specific **words or phrases in the tet**.
-
-**Trigger phrases:**  
-- “how many contracts mention…”  
-- “how many contain/include/mention the phrase…”  
-- “how many say ‘governing law’…”  
-- user quotes a phrase (e.g. “force majeure”) and wants count
-
-Use only when the question is explicitly about **textual content** (not metadata or status).
-
----
-
-### 🔹 text_snippets  
-Return snippets of contract text that include or surround keywords or concepts.
-
-**Trigger phrases:**  
-- “show snippets where…”  
-- “give examples of clauses that mention…”  
-- “snippets with indemnification near liability”  
-- “show me the text around ‘termination’”  
-- any mention of “near”, “snippet”, or "context around"
-
-Also supports proximity logic (e.g. “X near Y”).
-
----
-
-### 🔹 sql_generic  
-Questions about contract **metadata, filters, counts, or time windows** — not specific wording.
-
-**Trigger phrases / patterns:**  
-- “how many contracts were executed/signed/completed…”  
-- “how many NDAs were created last quarter”  
-- “how many contracts were finished this month”  
-- “how many workflows are pending approval”  
-- “list of contracts signed by Johnson & Johnson”  
-- anything about vendor, status, execution date, contract value, type, department, etc.
-
-Also use when:
-- user asks about **clause types** generically (e.g., “how many contracts have an indemnity clause”)
-- question includes **date/time filters** but is not about specific phrases
-
-⛔️ Do **not** use `text_mention_count` for time-based execution questions — those are `sql_generic`.
-
----
-
-### 🔹 summarize_contract  
-User asks for a summary of a specific contract.
-
-**Trigger phrases:**  
-- “summarize IC-1234”  
-- “what’s the overview of IC-9876”
-
-Requires a single `readable_id`.
-
----
-
-### 🔹 compare_contracts  
-User wants a comparison of two contracts.
-
-**Trigger phrases:**  
-- “compare IC-1234 and IC-5678”  
-- “how does IC-4444 differ from IC-1111”
-
-Requires two `readable_ids`.
-
----
-
-### 🔹 similar_to_contract  
-User wants to find contracts that resemble a given one.
-
-**Trigger phrases:**  
-- “find contracts similar to IC-7890”  
-- “which contracts are like IC-2345”
-
----
-
-### 🔹 semantic_find  
-Conceptual or topical search without specific phrases.
-
-**Trigger phrases:**  
-- “find contracts about IP ownership”  
-- “which contracts are related to data privacy”  
-- “any agreements that deal with subcontractors”  
-- general topic-based exploration
-
-Use when the user is describing a **concept** they want to find, not a specific clause or term.
-
----
-
-### 🔹 rag_text_qa
-Broad natural-language questions that require reading or interpreting contract text,
-not just metadata or phrase matching.
-
-Use this when the user asks about the *content* or *meaning* of clauses,
-sections, or terms — even if they don’t quote words or use “snippet”.
+You classify a legal-contracts assistant user's request. Return STRICT JSON only:
+{"intent": "<one intent below>", "terms": [string], "logic": {"operator": "AND|OR", "exclude": [string]},
+ "near": {"enabled": true|false, "window": 120}, "readable_ids": [string like IC-1234],
+ "query_text": string|null, "vendor_term": string|null, "notes": string|null, "title_terms": [string]}
+
+NON-NEGOTIABLE: "query_text" is an EXACT character-for-character copy of the user's question. Never rephrase,
+shorten or expand it, and never add words (contract, clause, vendor names, IC ids, inferred attributes).
+
+INTENTS:
+- text_mention_count: how many contracts contain specific words/phrases in their TEXT (not metadata/status). Put the phrases in "terms".
+- text_snippets: show text excerpts around keywords; any "snippet", "near", "context around", "show the text around". X near Y → near.enabled.
+- sql_generic: metadata, filters, counts, time windows — vendor, status, execution/created date, value, type, department, approvals, lists of contracts.
+- summarize_contract: summary/overview of one contract (one readable_id).
+- compare_contracts: compare two contracts (two readable_ids).
+- similar_to_contract: contracts resembling a given IC id.
+- semantic_find: find contracts about a concept/topic, no specific phrase ("contracts related to data privacy").
+- rag_text_qa: questions needing the contract TEXT read or interpreted — what a contract/clause says, means or defines, even unquoted
+  ("what does IC-6420 say about termination?", "how is governing law handled?", "what do the MSAs say about data privacy?"). Scope may be one contract or many.
+- weekly_report: ONLY an explicit request for the full multi-section weekly/legal team report ("generate the weekly report").
 
-**Trigger examples, not limited to these, use these as a guide and interpret the question to see if it is a RAG text question:**
-- “what does IC-6420 say about termination?”
-- “explain the confidentiality clause in this agreement”
-- “what does the contract say about payment terms?”
-- “how is governing law handled?”
-- “does this mention how many hours the vendor works?”
-- “what does it say about subcontractors?”
-- “how does this define intellectual property?”
-- “where does it describe indemnification?”
-- “show me the language covering warranties”
-- “tell me what the MSAs say about data privacy”
-- “how are service levels described?”
-
-**Key difference:**  
-If the question requires *interpreting* or *retrieving text language*,
-rather than counting or filtering by metadata, it is `rag_text_qa`.
-
-Scope can be a single contract (e.g., “IC-6927”) or many (e.g., “our NDAs”);
-the system will decide dynamically.
-
----
-### 🔹 weekly_report  
-User explicitly requests the **full Legal & Contract Weekly Report** — a structured summary of multiple metrics (the 11-section bundle).
-
-Only classify as `weekly_report` when the user clearly asks for a **formal report or overview**, not just when they mention a timeframe.
-
-**Trigger phrases (explicit requests only):**
-- “generate the weekly report”
-- “create the weekly legal report”
-- “show me the full weekly report”
-- “make the weekly report”
-- “weekly report for legal team”
-- “give me the legal team report”
-- “generate the full report for this week”
-
-**Do NOT use this intent** for general time-based questions such as:
-- “how many contracts were created this week”
-- “show contracts completed this week”
-- “what’s the spend this week”
-Those should remain `sql_generic`.
-
-In summary:
-- `weekly_report` = user explicitly wants the multi-section weekly summary.
-- `sql_generic` = any normal analytical or timeframe question (even if it includes 'week' or 'weekly').
-
----
-
-## GENERAL RULES:
-- If the user mentions **“clause” or “clauses”**, and isn't asking for text/snippets → `sql_generic`
-- If the user asks **how many contracts contain specific phrases**, or quotes wording → `text_mention_count`
-- If the user wants **text excerpts or examples** → `text_snippets`
-- If the user question involves **time + status** (executed/signed/created in last X), it is ALWAYS `sql_generic`
-- If unsure between `text_mention_count` and `sql_generic`, ask:  
-   ❓ “is the user talking about the actual wording inside contracts?” → text  
-   ❓ “or just filtering based on metadata/date/status?” → sql_generic
-
-NEVER include SQL or implementation logic. Just classify intent based on the user's language.
+RULES:
+- "clause"/"clauses" mentioned and not asking for text or snippets → sql_generic ("how many contracts have an indemnity clause").
+- Quoted wording, or "how many contracts contain/mention <phrase>" → text_mention_count.
+- Time + status (executed/signed/created/completed in last X) → ALWAYS sql_generic, never text_mention_count.
+- Timeframe questions that mention "week"/"weekly" but are not the full report ("how many contracts were created this week") → sql_generic.
+- Unsure between text_mention_count and sql_generic: about actual wording inside contracts → text; filtering on metadata/date/status → sql_generic.
+- Never include SQL. Only classify.
+
+TITLE_TERMS: the exact lowercased words the user typed that identify a contract title — company/vendor names
+(hamilton, lonza), contract-type indicators (nda, msa, dmsa, cda, sow), product/model ids (abc123). Never topic or
+clause words (confidentiality, payment) or filler (what, does, show, about); never invent words; [] if none.
+"What does the Hamilton Company NDA say about confidentiality?" → ["hamilton", "company", "nda"]
 """
 
 
+FIRST_BRACE_RE = re.compile(r"\{")
+_JSON_DECODER = json.JSONDecoder()
+
 def _extract_first_json(txt:str)->str:
     t=(txt or "").strip()
     if t.startswith("{") and t.endswith("}"): return t
-    depth=0; start=None
-    for i,ch in enumerate(t):
-        if ch=="{":
-            if depth==0: start=i
-            depth+=1
-        elif ch=="}":
-            depth-=1
-            if depth==0 and start is not None:
-                return t[start:i+1]
+    # try each '{' in turn; the C decoder does the brace matching
+    for m in FIRST_BRACE_RE.finditer(t):
+        try:
+            _, end = _JSON_DECODER.raw_decode(t, m.start())
+        except ValueError:
+            continue
+        return t[m.start():end]
     return "{}"
 
+def _loads_json_reply(txt: str) -> Dict[str, Any]:
+    """Parse a JSON-mode reply; the brace scan is only a fallback."""
+    try:
+        return orjson.loads(txt or "{}")
+    except orjson.JSONDecodeError:
+        try:
+            return orjson.loads(_extract_first_json(txt))
+        except orjson.JSONDecodeError:
+            return {}
+
+# Deterministic rules: (intent, number of IC ids required, trigger pattern)
+INTENT_RULES = (
+    ("summarize_contract", 1, re.compile(r"\b(summari[sz]e|summary|overview|tl;?dr)\b", re.IGNORECASE)),
+    ("compare_contracts", 2, re.compile(r"\b(compare|comparison|differ\w*|vs\.?|versus)\b", re.IGNORECASE)),
+    ("similar_to_contract", 1, re.compile(r"\b(similar|resembl\w*|(contracts?|ones|agreements?) like)\b", re.IGNORECASE)),
+    ("weekly_report", 0, re.compile(r"\b(weekly|legal(\s+team)?)\s+report\b", re.IGNORECASE)),
+)
+
+def _rule_intent(q: str, ids: List[str], quoted: List[str]) -> Optional[Dict[str, Any]]:
+    """Intent for unambiguous phrasings (e.g. "summarize IC-1234"), else None."""
+    if quoted:
+        return None
+    for intent, n_ids, pattern in INTENT_RULES:
+        if len(ids) == n_ids and pattern.search(q):
+            return {"intent": intent, "readable_ids": ids, "query_text": q, "notes": "rule"}
+    return None
+
+INTENT_CACHE_MAX = 4096
+INTENT_MAX_TOKENS = 300       # intent JSON echoes the question in query_text
+_intent_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()  # blake2b(q) -> intent json
+_intent_cache_lock = threading.Lock()
+
 def classify_intent(q: str) -> Dict[str, Any]:
-    ids = [m.group(0).upper() for m in IC_ID_RE.finditer(q)]
-    quoted = re.findall(r"['\"]([^'\"]+)['\"]", q)
-    hints = {"readable_ids_detected": ids, "quoted_terms_detected": quoted}
+    # Keyed on the exact question: query_text must echo it verbatim, so
+    # case/whitespace variants are not folded together.
+    key = hashlib.blake2b(q.encode("utf-8"), digest_size=16).digest()
+    with _intent_cache_lock:
+        hit = _intent_cache.get(key)
+        if hit is not None:
+            _intent_cache.move_to_end(key)
+            return copy.deepcopy(hit)
+    js = _classify_intent_uncached(q)
+    with _intent_cache_lock:
+        _intent_cache[key] = copy.deepcopy(js)
+        while len(_intent_cache) > INTENT_CACHE_MAX:
+            _intent_cache.popitem(last=False)
+    return js
 
-    msgs = [
-        {"role": "system", "content": INTENT_SYSTEM_PROMPT},
-        {"role": "system", "content": "HINTS: " + json.dumps(hints)},
-        {"role": "user", "content": q},
-    ]
+def _classify_intent_uncached(q: str) -> Dict[str, Any]:
+    ids = [m.group(0).upper() for m in IC_ID_RE.finditer(q)]
+    quoted = QUOTED_TERM_RE.findall(q)
+
+    js = _rule_intent(q, ids, quoted)
+    if js is None:
+        hints = {"readable_ids_detected": ids, "quoted_terms_detected": quoted}
+        # The static prompt leads and the per-turn hints follow it, so the
+        # prefix is byte-identical across calls (cacheable by OpenAI); the
+        # cache key keeps those calls on one shard.
+        msgs = [
+            {"role": "system", "content": INTENT_SYSTEM_PROMPT},
+            {"role": "system", "content": "HINTS: " + dumps_json(hints)},
+            {"role": "user", "content": q},
+        ]
 
-    resp = client.chat.completions.create(model="gpt-4o-mini",
-                                          temperature=0,
-                                          messages=msgs)
-    content = resp.choices[0].message.content or "{}"
-    print("DEBUG RAW INTENT LLM OUTPUT:", content)
+        resp = client.chat.completions.create(model="gpt-4o-mini",
+                                              temperature=0,
+                                              messages=msgs,
+                                              response_format=JSON_MODE,
+                                              max_tokens=INTENT_MAX_TOKENS,
+                                              extra_body={"prompt_cache_key": "classify_intent"})
+        content = resp.choices[0].message.content or "{}"
+        log.debug("RAW INTENT LLM OUTPUT: %s", content)
 
-    try:
-        js = json.loads(_extract_first_json(content))
-    except:
-        js = {}
+        js = _loads_json_reply(content)
 
     # Default shape
     js.setdefault("intent", "sql_generic")
@@ -761,7 +978,7 @@ def classify_intent(q: str) -> Dict[str, Any]:
     # Normalize readable IDs → IC-#### only
     valid_ids = []
     for rid in js["readable_ids"]:
-        if isinstance(rid, str) and re.fullmatch(r"IC-\d+", rid.strip(), re.IGNORECASE):
+        if isinstance(rid, str) and IC_ID_FULL_RE.fullmatch(rid.strip()):
             valid_ids.append(rid.upper())
     js["readable_ids"] = valid_ids
 
@@ -769,11 +986,17 @@ def classify_intent(q: str) -> Dict[str, Any]:
     js.setdefault("vendor_term", None)
     js.setdefault("notes", None)
 
+    # Title terms ride along on the LLM call; absent (rule/local paths) means
+    # answer_question falls back to extract_title_terms().
+    if "title_terms" in js:
+        tt = js["title_terms"] if isinstance(js["title_terms"], list) else []
+        js["title_terms"] = [w.lower() for w in tt if isinstance(w, str)]
+
     # Clause rule
     if "clause" in q.lower():
         js["intent"] = "sql_generic"
 
-    print("DEBUG FINAL INTENT JSON:", js)
+    log.debug("FINAL INTENT JSON: %s", js)
 
     # Final sanitize (guaranteed list — safe to iterate)
     ids = js.get("readable_ids", [])
@@ -790,61 +1013,58 @@ def classify_intent(q: str) -> Dict[str, Any]:
 
 
 
+# Title-term extraction without an LLM: the words the user typed that occur
+# in stored contract titles (minus generic and clause/topic ones), plus
+# contract-type abbreviations.
+TITLE_VOCAB_TTL = 600  # seconds between title-vocabulary re-reads
+TITLE_SIM_MIN = 0.2    # pg_trgm similarity a title needs to the heuristic terms
+CONTRACT_TYPE_TERMS = frozenset({"nda", "mnda", "msa", "dmsa", "cda", "sow"})
+GENERIC_TITLE_WORDS = frozenset({
+    "agreement", "agreements", "contract", "contracts", "amendment", "master",
+    "services", "service", "and", "the", "for", "with", "inc", "llc",
+})
+# Words that also occur in titles but, in a question, name what is asked
+# about rather than which contract ("what does the Hamilton NDA say about
+# confidentiality?"). Dropped so they don't dilute the title similarity.
+CLAUSE_TOPIC_WORDS = frozenset({
+    "confidentiality", "confidential", "termination", "payment", "payments", "pricing",
+    "price", "data", "privacy", "security", "protection", "liability", "indemnity",
+    "indemnification", "warranty", "warranties", "insurance", "intellectual",
+    "property", "ownership", "license", "licensing", "governing", "law", "audit",
+    "exclusivity", "renewal", "term", "terms", "fees", "compliance",
+})
+
+_title_vocab_cache: Tuple[float, Optional[frozenset]] = (0.0, None)  # (fetched_at, words)
+
+def _title_vocab() -> frozenset:
+    """Lowercased words (3+ chars) of contract titles, re-read every TITLE_VOCAB_TTL."""
+    global _title_vocab_cache
+    fetched_at, vocab = _title_vocab_cache
+    if vocab is None or time.time() - fetched_at > TITLE_VOCAB_TTL:
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT lower(w)
+                FROM ic.contract_texts, regexp_split_to_table(title, '[^A-Za-z0-9]+') AS w
+                WHERE length(w) >= 3
+            """)
+            vocab = frozenset(r[0] for r in cur.fetchall()) - GENERIC_TITLE_WORDS - CLAUSE_TOPIC_WORDS
+        _title_vocab_cache = (time.time(), vocab)
+    return vocab
+
 def extract_title_terms(question: str) -> List[str]:
     """
-    Extract the specific title-identifying words the user typed.
-    This uses ONLY the question itself (no title list).
+    Candidate title words the user typed: those in the vocabulary of stored
+    titles, which may still include filler (the caller ranks titles by
+    similarity rather than requiring each word); [] if the vocabulary
+    can't be read (the caller then reports no matching title).
     """
-
-    system_prompt = (
-        "Your ONLY task is to extract the exact user-typed words that identify a contract title.\n"
-        "You do NOT answer the question.\n"
-        "You do NOT need to know the list of titles.\n"
-        "You ONLY pull out the meaningful title-indicating words the user typed.\n\n"
-
-        "WHAT TO EXTRACT:\n"
-        "- Company/vendor names (e.g., hamilton, lonza, pfizer, stanford)\n"
-        "- Contract-type indicators the user typed (e.g., nda, msa, dmsa, cda, sow)\n"
-        "- Product/model identifiers if present (e.g., abc123)\n\n"
-
-        "WHAT NOT TO EXTRACT:\n"
-        "- Clause/topic words (confidentiality, payment, pricing)\n"
-        "- Generic verbs or filler language (what, does, say, show, about)\n\n"
-
-        "EXAMPLES:\n"
-        "User: 'What does the Hamilton Company NDA say about confidentiality?'\n"
-        "Output: {\"title_terms\": [\"hamilton\", \"company\", \"nda\"]}\n\n"
-        "User: 'Explain the Lonza DMSA termination clause'\n"
-        "Output: {\"title_terms\": [\"lonza\", \"dmsa\"]}\n\n"
-        "User: 'Show me what the Pfizer Master Services Agreement says about IP'\n"
-        "Output: {\"title_terms\": [\"pfizer\", \"master\", \"services\"]}\n\n"
-
-        "RULES:\n"
-        "- Only return words the user actually typed.\n"
-        "- Lowercase all extracted words.\n"
-        "- Never hallucinate or infer new words.\n"
-        "- Always output strict JSON: {\"title_terms\": [ ... ]}"
-    )
-
-    user_prompt = f"User Question: \"{question}\""
-
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-    )
-
-    txt = resp.choices[0].message.content or "{}"
-
     try:
-        js = json.loads(_extract_first_json(txt))
-        out = js.get("title_terms", [])
-        return [w.lower() for w in out if isinstance(w, str)]
-    except Exception:
+        vocab = _title_vocab()
+    except Exception as e:
+        log.warning("title vocabulary unavailable: %s", e)
         return []
+    words = dict.fromkeys(WORD_RE.findall(question.lower()))
+    return [w for w in words if w in CONTRACT_TYPE_TERMS or w in vocab]
 
 
 # =========================================================
@@ -866,63 +1086,44 @@ def _not_frag(alias,terms):
         params.append(f"%{t}%")
     return " AND " + " AND ".join(frags), params
 
+# A whole single-quoted literal ('' escapes; unterminated runs to the end),
+# or a %s placeholder outside one (group 1).
+SQL_PLACEHOLDER_RE = re.compile(r"'(?:[^']+|'')*(?:'|\Z)|(%s)")
+
 def _count_unquoted_percent_s(sql: str) -> int:
     """
     Counts %s placeholders that are OUTSIDE single-quoted string literals.
     Treats doubled quotes ('') as an escaped single quote.
     """
-    count = 0
-    in_single = False
-    i = 0
-    n = len(sql)
-    while i < n:
-        ch = sql[i]
-        if ch == "'":
-            if in_single:
-                if i + 1 < n and sql[i + 1] == "'":
-                    i += 2
-                    continue
-                in_single = False
-                i += 1
-                continue
-            else:
-                in_single = True
-                i += 1
-                continue
-        if not in_single and ch == "%" and i + 1 < n and sql[i + 1] == "s":
-            count += 1
-            i += 2
-            continue
-        i += 1
-    return count
+    return sum(1 for m in SQL_PLACEHOLDER_RE.finditer(sql) if m.group(1))
+
+# Literals and comments are consumed whole; group 1 = a statement-ending
+# ';', group 2 = a comment on its own line (a section title).
+SQL_SECTION_RE = re.compile(r"'(?:[^']+|'')*(?:'|\Z)|(;)|^[ \t]*(--[^\n]*)|--[^\n]*", re.MULTILINE)
 
 def _extract_sections(sql_block: str):
     """
     Split a multi-statement SQL block into sections with optional titles.
     Title taken from nearest preceding '-- ...' comment.
     """
-    parts = [p for p in sql_block.split(";") if p.strip()]
     sections = []
-    src = sql_block.splitlines()
-    buf = []
-    current_title = None
-    for line in src:
-        if line.strip().startswith("--"):
-            current_title = line.strip().lstrip("-").strip()
-        buf.append(line)
-        if ";" in line:
-            stmt = "\n".join(buf).strip()
-            sections.append({"title": current_title, "sql": stmt.rstrip(";").strip()})
-            buf = []
-            current_title = None
-    leftover = "\n".join(buf).strip()
-    if leftover:
-        sections.append({"title": current_title, "sql": leftover})
-    out = []
-    for s in sections:
-        if re.search(r"\bselect\b", s["sql"], re.IGNORECASE):
-            out.append({"title": s["title"], "sql": s["sql"]})
-    return out
+    start = 0
+    pending_title: Optional[str] = None
+    block = sql_block + "\n;"  # close the last statement like any other
+    for m in SQL_SECTION_RE.finditer(block):
+        if m.group(2) is not None:
+            pending_title = m.group(2).lstrip("-").strip()
+        elif m.group(1) is not None:
+            stmt = block[start:m.start()].strip()
+            if SELECT_RE.search(stmt):
+                sections.append({"title": pending_title, "sql": stmt})
+            start = m.end()
+            pending_title = None
+    return sections
+
+NUMERIC_STR_RE = re.compile(r"-?\d+(\.\d+)?")
+NUMERIC_TYPES = (int, float, Decimal)
+WORD_RE = re.compile(r"[a-zA-Z0-9]+")
 
 def _derive_metric(cols, rows):
     """
@@ -933,13 +1134,87 @@ def _derive_metric(cols, rows):
         return (None, None)
     if len(rows) == 1:
         row = rows[0]
+        # typed numbers first (no regex); numeric strings only as a fallback
+        for ci, cv in enumerate(row):
+            if isinstance(cv, NUMERIC_TYPES):
+                return (cols[ci], cv)
         for ci, cv in enumerate(row):
-            if isinstance(cv, (int, float, Decimal)) or (
-                isinstance(cv, str) and re.fullmatch(r"-?\d+(\.\d+)?", cv or "")
-            ):
+            if isinstance(cv, str) and NUMERIC_STR_RE.fullmatch(cv):
                 return (cols[ci], cv)
     return (None, None)
 
+# =========================================================
+# Semantic answer cache (mention counts + single-contract RAG QA)
+# =========================================================
+# The one similarity-based answer cache (app.py only replays exact repeats).
+# A near-identical question under the same key (intent + contract id, or
+# intent + search terms) replays the finished answer instead of re-running
+# SQL and the LLM. Entries expire after ANSWER_CACHE_TTL and are dropped early if any
+# contract they drew on has been re-synced since.
+ANSWER_CACHE_TTL = 300
+ANSWER_CACHE_MAX = 256
+ANSWER_CACHE_MIN_SIM = float(os.getenv("ANSWER_CACHE_MIN_SIM", "0.92"))  # > 1 disables
+
+# (key, unit q_emb, stored_at, readable_ids, tokens, result_without_stream)
+_answer_cache: List[Tuple[Any, np.ndarray, float, Tuple[str, ...], List[str], Dict[str, Any]]] = []
+_answer_cache_lock = threading.Lock()
+
+def _unit_query_emb(q: str) -> np.ndarray:
+    q_emb = np.asarray(embed_query(q), dtype=np.float32)
+    q_emb /= np.linalg.norm(q_emb) or 1.0
+    return q_emb
+
+def _contracts_updated_since(readable_ids: Tuple[str, ...], ts: float) -> bool:
+    if not readable_ids:
+        return False
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT 1 FROM ic.contract_texts WHERE readable_id = ANY(%s) AND updated_at > to_timestamp(%s) LIMIT 1",
+            (list(readable_ids), ts),
+        )
+        return cur.fetchone() is not None
+
+def answer_cache_lookup(key: Any, q_emb: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Return a replayable result for the closest cached question under key, or None."""
+    now = time.time()
+    with _answer_cache_lock:
+        _answer_cache[:] = [e for e in _answer_cache if now - e[2] <= ANSWER_CACHE_TTL]
+        cands = [e for e in _answer_cache if e[0] == key]
+        if not cands:
+            return None
+        sims = np.stack([e[1] for e in cands]) @ q_emb
+        best = int(sims.argmax())
+        if sims[best] < ANSWER_CACHE_MIN_SIM:
+            return None
+        entry = cands[best]
+    if _contracts_updated_since(entry[3], entry[2]):
+        with _answer_cache_lock:
+            _answer_cache[:] = [e for e in _answer_cache if e is not entry]
+        return None
+    result = copy.deepcopy(entry[5])
+    result["stream"] = iter(entry[4])
+    return result
+
+def answer_cache_record(result: Dict[str, Any], key: Any, q_emb: np.ndarray,
+                        readable_ids) -> Dict[str, Any]:
+    """Wrap result["stream"] so a fully consumed answer is stored under key."""
+    meta = copy.deepcopy({k: v for k, v in result.items() if k != "stream"})
+    ids = tuple(dict.fromkeys(i for i in readable_ids if i))
+    stream = result["stream"]
+
+    def _recording():
+        stored_at = time.time()  # before the answer, so re-syncs during it still invalidate
+        tokens = []
+        for tok in stream:
+            tokens.append(tok)
+            yield tok
+        with _answer_cache_lock:
+            _answer_cache.append((key, q_emb, stored_at, ids, tokens, meta))
+            del _answer_cache[:-ANSWER_CACHE_MAX]
+
+    result["stream"] = _recording()
+    return result
+
 # =========================================================
 # Main answer function (now stateful)
 # =========================================================
@@ -973,9 +1248,29 @@ def answer_question(
         merged = list(dict.fromkeys(scope["relevant_history"] + extra_labels))
         scope["relevant_history"] = merged[-20:]
 
+    # -- (1)+(2) History selector and follow-up rewriter run concurrently.
+    # The selector doesn't look at the new question, so the rewriter doesn't
+    # wait for it: it gets the history carried over from earlier turns, and
+    # this turn's selection feeds scope for the next one.
+    hs_future = _llm_pool.submit(
+        history_selector, conversation_summary, scope, resolved_question, primary_response
+    )
+    # Speculative intent on the raw question: it is the resolved question on
+    # first turns and for non-follow-ups, so it's usually the one we need.
+    intent_future = _llm_pool.submit(classify_intent, question)
+    rew_future = None
+    if last_question is not None:
+        rew_future = _llm_pool.submit(
+            followup_rewriter,
+            user_text=question,
+            relevant_history=scope["relevant_history"][-10:],
+            scope=dict(scope),
+            prior_resolved_question=resolved_question,
+        )
+
     # -- (1) History selector: compress prior context into focused bullets + updated summary
     # Merge new bullets with old to persist memory beyond one turn
-    hs = history_selector(conversation_summary, scope, resolved_question, primary_response)
+    hs = hs_future.result()
     new_relevant = hs.get("relevant_history", [])
     if conversation_summary and "relevant_history" in scope:
         combined_history = list(dict.fromkeys(scope["relevant_history"] + new_relevant))
@@ -989,36 +1284,34 @@ def answer_question(
     scope["relevant_history"] = merged_history[-20:]
 
     # -- (2) Follow-up detector + rewriter (preferred path)
-    print("DEBUG FIRST-TURN CHECK — last_question:", last_question)
-    print("DEBUG FIRST-TURN CHECK — prior_resolved_question:", resolved_question)
-    print("DEBUG FIRST-TURN CHECK — is_followup BEFORE rewriter SHOULD BE FALSE")
+    log.debug("FIRST-TURN CHECK — last_question: %s", last_question)
+    log.debug("FIRST-TURN CHECK — prior_resolved_question: %s", resolved_question)
+    log.debug("FIRST-TURN CHECK — is_followup BEFORE rewriter SHOULD BE FALSE")
 
         # --- FIRST TURN SAFETY: do NOT rewrite the user's question ---
     if last_question is None:
-        print("DEBUG: FIRST TURN — SKIPPING REWRITER ENTIRELY")
+        log.debug("FIRST TURN — SKIPPING REWRITER ENTIRELY")
         is_followup_turn = False
         resolved_q = question
 
         # Ensure rew exists so later code does not crash
         rew = {"reset_keys": [], "scope_updates": {}}
     else:
-        rew = followup_rewriter(
-            user_text=question,
-            relevant_history=relevant_history,
-            scope=scope,
-            prior_resolved_question=resolved_question
-        )
+        rew = rew_future.result()
         is_followup_turn = bool(rew.get("is_followup"))
         resolved_q = rew.get("resolved_question") or question
 
 
-    print("DEBUG IS_FOLLOWUP_TURN:", is_followup_turn)
-    print("DEBUG RESOLVED_Q AFTER FIRST-TURN LOGIC:", resolved_q)
+    log.debug("IS_FOLLOWUP_TURN: %s", is_followup_turn)
+    log.debug("RESOLVED_Q AFTER FIRST-TURN LOGIC: %s", resolved_q)
 
     # -- (3) Intent classification on the RESOLVED question
-    intent = classify_intent(resolved_q)
-    print("DEBUG INTENT:", intent)
-    print("DEBUG RESOLVED QUESTION:", resolved_q)
+    if resolved_q == question:
+        intent = intent_future.result()
+    else:
+        intent = classify_intent(resolved_q)
+    log.debug("INTENT: %s", intent)
+    log.debug("RESOLVED QUESTION: %s", resolved_q)
 
 
     # Merge scope updates & apply resets when the rewriter signals a new topic
@@ -1061,18 +1354,24 @@ def answer_question(
         # Only proceed if we now have an ID
         if intent.get("readable_ids"):
             rid = intent["readable_ids"][0]
+            # Leading chunks up to 180k chars in total, cut in SQL so the rest
+            # never leave the server.
             cols, rows = run_sql(
-                "SELECT chunk_id,chunk_text FROM ic.contract_chunks WHERE readable_id=%s ORDER BY chunk_id",
-                (rid,),
+                """
+                SELECT chunk_id, chunk_text
+                FROM (
+                    SELECT chunk_id, chunk_text,
+                           SUM(char_length(chunk_text)) OVER (ORDER BY chunk_id) AS cum
+                    FROM ic.contract_chunks
+                    WHERE readable_id=%s
+                ) c
+                WHERE cum <= %s
+                ORDER BY chunk_id
+                """,
+                (rid, 180_000),
                 max_rows=5000,
             )
-            texts = [r[1] for r in rows]
-            acc, out = 0, []
-            for t in texts:
-                if acc + len(t) > 180_000:
-                    break
-                out.append(t)
-                acc += len(t)
+            out = [r[1] for r in rows]
 
             stream = stream_contract_summary_from_text(
                 {
@@ -1112,67 +1411,50 @@ def answer_question(
 
 
         # Attempt fallback: check title match if no IC-ID provided
-        # Attempt fallback: fuzzy title match using model-based title term extraction
+        # Attempt fallback: fuzzy title match on the title words the user typed
         if not readable_ids:
-            # 1. Fetch known titles (anchor set)
-            # -------------------------------------------
-            # NEW PREFILTER: detect user words & limit title set BEFORE LLM extraction
-            # -------------------------------------------
-            # Extract raw user-typed words
-            raw_words = re.findall(r"[a-zA-Z0-9]+", resolved_q.lower())
-            title_words = [w for w in raw_words if len(w) >= 3]
-            print("DEBUG RAW WORDS:", raw_words)
-            print("DEBUG TITLE WORDS (words >=3 chars):", title_words)
-
-
-            prefiltered_titles = []
-            if title_words:
-                where_clauses = " AND ".join(["LOWER(title) ILIKE %s" for _ in title_words])
-                params = [f"%{w}%" for w in title_words]
-
-                sql_prefilter = f"""
-                    SELECT title
-                    FROM ic.contract_texts
-                    WHERE {where_clauses}
-                    LIMIT 10
-                """
-
-                print("DEBUG PREFILTER TITLE SQL:", sql_prefilter)
-                print("DEBUG PREFILTER PARAMS:", params)
-
-                cols, title_rows = run_sql(sql_prefilter, tuple(params))
-                prefiltered_titles = [r[0] for r in title_rows if r[0]]
-                print("DEBUG PREFILTERED_TITLES_COUNT:", len(prefiltered_titles))
-                print("DEBUG FIRST_5_PREFILTERED_TITLES:", prefiltered_titles[:5])
-
-
-
-            candidate_terms = extract_title_terms(resolved_q)
-            print("DEBUG CANDIDATE TERMS FROM LLM:", candidate_terms)
-            print("DEBUG TITLE TERMS:", candidate_terms)
-
-            print("DEBUG TYPE OF CANDIDATE_TERMS:", type(candidate_terms))
+            llm_terms = "title_terms" in intent
+            candidate_terms = intent["title_terms"] if llm_terms else extract_title_terms(resolved_q)
+            log.debug("TITLE TERMS: %s", candidate_terms)
             if candidate_terms:
-                like_clauses = " AND ".join(["LOWER(title) ILIKE %s" for _ in candidate_terms])
-                params = [f"%{t}%" for t in candidate_terms]
-
-                sql = f"""
-                    SELECT readable_id
-                    FROM ic.contract_texts
-                    WHERE {like_clauses}
-                    ORDER BY updated_at DESC
-                    LIMIT 1
-                """
-
-                print("DEBUG TITLE SEARCH SQL:", sql)
-                print("DEBUG TITLE SEARCH PARAMS:", params)
-
-                cols, rows = run_sql(sql, tuple(params))
+                joined = " ".join(candidate_terms)
+                like_params = [f"%{t}%" for t in candidate_terms]
+                if llm_terms:
+                    # The LLM keeps only title-identifying words, so every term
+                    # must occur in the title (the trigram index on lower(title)
+                    # serves each LIKE); among those, the closest title wins.
+                    like_clauses = " AND ".join(["lower(title) LIKE %s" for _ in candidate_terms])
+                    params = like_params + [joined]
+                    sql = f"""
+                        SELECT readable_id
+                        FROM ic.contract_texts
+                        WHERE {like_clauses}
+                        ORDER BY similarity(lower(title), %s) DESC, updated_at DESC
+                        LIMIT 1
+                    """
+                else:
+                    # Vocabulary hits can include filler or topic words that
+                    # merely occur in some title, so no single term is required:
+                    # titles trigram-similar to all terms together (index-served
+                    # %), ranked by how many terms they contain, then similarity.
+                    matched = " + ".join(["(lower(title) LIKE %s)::int" for _ in candidate_terms])
+                    params = [joined] + like_params + [joined]
+                    sql = f"""
+                        SELECT readable_id
+                        FROM ic.contract_texts
+                        WHERE lower(title) %% %s
+                        ORDER BY ({matched}) DESC, similarity(lower(title), %s) DESC, updated_at DESC
+                        LIMIT 1
+                    """
+
+                log.debug("TITLE SEARCH SQL: %s", sql)
+                log.debug("TITLE SEARCH PARAMS: %s", params)
+
+                cols, rows = run_sql(sql, tuple(params),
+                                     trgm_threshold=None if llm_terms else TITLE_SIM_MIN)
                 if rows:
                     readable_ids = [rows[0][0]]
 
-
-
         is_single_contract = len(readable_ids) == 1
         rid = readable_ids[0] if is_single_contract else None
         if not readable_ids:
@@ -1191,61 +1473,68 @@ def answer_question(
                     "context": "title fallback failure"
                 }
             }
-        qvec = embed_query(resolved_q)
+        if is_single_contract:
+            # Remember active contract for follow-ups
+            scope["active_contract_id"] = rid
+
+        # Only single-contract answers are cached: the contract id pins what
+        # the answer is about, so similarity only has to match the question.
+        # Corpus-wide questions ("what do our NDAs say…" vs "…MSAs…") differ
+        # in words embeddings barely weigh. The prompt is only the resolved
+        # question plus retrieved chunks, so follow-ups can share answers too.
+        cache_key = q_emb = None
+        if ANSWER_CACHE_MIN_SIM <= 1 and is_single_contract:
+            cache_key, q_emb = ("rag_text_qa", rid), _unit_query_emb(resolved_q)
+            cached = answer_cache_lookup(cache_key, q_emb)
+            if cached:
+                cached.update(intent_json=intent, conversation_summary=updated_summary,
+                              scope=scope, resolved_question=resolved_q)
+                return cached
+
+        # Bound once in a CTE: the ~12 KB literal is sent and parsed once per
+        # query, and the HNSW index still serves ORDER BY via the InitPlan param.
+        qlit = query_vector_literal(resolved_q)
 
 
         if is_single_contract:
             # single-contract: narrow to one doc
-            # Remember active contract for follow-ups
-            scope["active_contract_id"] = rid
             sql = """
+                WITH q AS (SELECT %s::halfvec AS v)
                 SELECT readable_id, chunk_id, chunk_text,
-                       (embedding <=> %s::vector) AS distance
+                       (embedding <=> (SELECT v FROM q)) AS distance
                 FROM ic.contract_chunks
                 WHERE readable_id = %s
-                ORDER BY embedding <=> %s::vector
+                ORDER BY embedding <=> (SELECT v FROM q)
                 LIMIT 24
             """
-            cols, rows = run_sql(sql, (vector_literal(qvec), rid, vector_literal(qvec)))
+            cols, rows = run_sql(sql, (qlit, rid), ef_search=RAG_EF_SEARCH)
         else:
-            # multi-contract: search corpus
+            # multi-contract: search corpus (bit-index candidates → cosine re-rank;
+            # chunk_text is only fetched for the final 40)
             sql = """
-                SELECT readable_id, chunk_id, chunk_text,
-                       (embedding <=> %s::vector) AS distance
-                FROM ic.contract_chunks
-                ORDER BY embedding <=> %s::vector
-                LIMIT 40
+                WITH q AS (SELECT %s::halfvec AS v),
+                cand AS (
+                    SELECT readable_id, chunk_id, embedding
+                    FROM ic.contract_chunks
+                    ORDER BY binary_quantize(embedding)::bit(1536) <~> binary_quantize((SELECT v FROM q))
+                    LIMIT %s
+                ),
+                top AS (
+                    SELECT readable_id, chunk_id, (embedding <=> (SELECT v FROM q)) AS distance
+                    FROM cand
+                    ORDER BY distance
+                    LIMIT 40
+                )
+                SELECT c.readable_id, c.chunk_id, c.chunk_text, top.distance
+                FROM top
+                JOIN ic.contract_chunks c USING (readable_id, chunk_id)
+                ORDER BY top.distance
             """
-            cols, rows = run_sql(sql, (vector_literal(qvec), vector_literal(qvec)))
-
-        # --- Prepare prompt dynamically ---
-        if is_single_contract:
-            system_prompt = (
-                f"You are a legal contracts analyst. Your primary source is the provided text "
-                f"chunks of contract {rid}. Cite exact phrases using (IC-#### #chunk_id) whenever possible.\n\n"
-
-                "RULES:\n"
-                "1. Always ground factual details (definitions, obligations, clauses) ONLY in the provided text.\n"
-                "2. If the user's question asks for evaluation, comparison, risk assessment, typicality, "
-                "industry standards, or interpretation that is NOT explicitly stated in the text:\n"
-                "      • You MAY use your general legal and commercial knowledge.\n"
-                "      • Make it clear when the text does NOT state something directly.\n"
-                "      • Provide a reasoned, professional opinion based on common contract practices.\n"
-                "3. Never fabricate contract-specific facts that are not in the text.\n"
-            )
-        else:
-            system_prompt = (
-                "You are a legal contracts analyst. Synthesize insights from multiple retrieved contracts.\n"
-                "Use the text as primary evidence but you MAY use general legal knowledge when the user asks for:\n"
-                "   • comparisons\n"
-                "   • risk assessments\n"
-                "   • industry-standard evaluations\n"
-                "   • typicality/market-norm commentary\n"
-                "Cite text when relevant. Do NOT fabricate contract-specific facts.\n"
-            )
-
+            cols, rows = run_sql(sql, (qlit, RAG_BQ_CANDIDATES), ef_search=RAG_BQ_CANDIDATES)
 
+        # Static system prompt first, every per-turn value in the user payload
         payload = {
+            "readable_id": rid,
             "question": resolved_q,
             "chunks": [
                 {"readable_id": r[0], "chunk_id": r[1], "text": r[2]}
@@ -1253,16 +1542,7 @@ def answer_question(
             ],
             "row_count": len(rows)
         }
-
-        stream = client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
-            ],
-            stream=True,
-        )
+        stream = _stream_with_system(RAG_SINGLE_SYS if is_single_contract else RAG_MULTI_SYS, payload)
 
         new_primary = {
             "type": "text",
@@ -1271,19 +1551,20 @@ def answer_question(
             "example_ids": [r[0] for r in rows[:5]]  # store top docs for follow-ups
         }
 
-        return {
+        result = {
             "sql": sql,
             "columns": cols,
-            "rows": safe_json(rows),
-            "stream": (chunk.choices[0].delta.content
-                       for chunk in stream
-                       if chunk.choices and chunk.choices[0].delta.content),
+            "rows": rows,
+            "stream": stream,
             "intent_json": intent,
             "conversation_summary": updated_summary,
             "scope": scope,
             "resolved_question": resolved_q,
             "primary_response": new_primary,
         }
+        if cache_key:
+            answer_cache_record(result, cache_key, q_emb, [r[0] for r in rows])
+        return result
 
     # ===========================================
     # Text mention count (keyword Boolean)
@@ -1294,6 +1575,19 @@ def answer_question(
             op = "AND"
         inc = intent.get("terms", [])
         exc = intent.get("logic", {}).get("exclude", [])
+        # Follow-ups carry primary_response into the prompt, so only fresh
+        # questions are cached; the terms are in the key so a similar-sounding
+        # question about another term never gets this count.
+        cache_key = q_emb = None
+        if ANSWER_CACHE_MIN_SIM <= 1 and not is_followup_turn:
+            cache_key = ("text_mention_count", op,
+                         tuple(sorted(t.lower() for t in inc)), tuple(sorted(t.lower() for t in exc)))
+            q_emb = _unit_query_emb(resolved_q)
+            cached = answer_cache_lookup(cache_key, q_emb)
+            if cached:
+                cached.update(intent_json=intent, conversation_summary=updated_summary,
+                              scope=scope, resolved_question=resolved_q)
+                return cached
         inc_where, inc_params = _ilike_clause_frag("c", inc, op)
         not_where, not_params = _not_frag("c", exc)
         sql = f"""WITH matches AS (
@@ -1316,7 +1610,7 @@ FROM matches"""
             "question": resolved_q,
             "sql": sql,
             "columns": cols,
-            "rows_preview": safe_json(rows[:50]),
+            "rows_preview": rows[:50],
             "row_count_returned": len(rows),
             "true_numeric_result": numeric_value,
             "intent": intent,
@@ -1332,7 +1626,7 @@ FROM matches"""
             "example_ids": example_ids  # carry IDs forward for follow-ups
         }
 
-        return {
+        result = {
             "sql": sql,
             "columns": cols,
             "rows": rows,
@@ -1343,6 +1637,9 @@ FROM matches"""
             "resolved_question": resolved_q,
             "primary_response": new_primary
         }
+        if cache_key:
+            answer_cache_record(result, cache_key, q_emb, example_ids)
+        return result
 
     # ===========================================
     # Text snippets (keyword & proximity)
@@ -1354,21 +1651,24 @@ FROM matches"""
         if len(terms) >= 2 and near.get("enabled", False):
             t1, t2 = terms[0], terms[1]
             win = int(near.get("window", 120))
-            pattern = f"(?is)({re.escape(t1)}.{{0,{win}}}{re.escape(t2)}|{re.escape(t2)}.{{0,{win}}}{re.escape(t1)})"
+            # Both terms as plain ILIKEs first: the trigram index narrows to
+            # chunks containing both, so the proximity regex only rechecks those.
+            pattern = f"{re.escape(t1)}.{{0,{win}}}{re.escape(t2)}|{re.escape(t2)}.{{0,{win}}}{re.escape(t1)}"
             sql = """SELECT readable_id,chunk_id,LEFT(chunk_text,300) AS snippet
-FROM ic.contract_chunks WHERE chunk_text ~ %s LIMIT %s"""
-            cols, rows = run_sql(sql, (pattern, limit))
+FROM ic.contract_chunks
+WHERE chunk_text ILIKE %s AND chunk_text ILIKE %s AND chunk_text ~* %s LIMIT %s"""
+            cols, rows = run_sql(sql, (f"%{t1}%", f"%{t2}%", pattern, limit))
         else:
             term = terms[0] if terms else "termination"
             sql = """SELECT readable_id,chunk_id,LEFT(chunk_text,300) AS snippet
-FROM ic.contract_chunks WHERE chunk_text ILIKE '%'||%s||'%' ORDER BY readable_id,chunk_id LIMIT %s"""
-            cols, rows = run_sql(sql, (term, limit))
+FROM ic.contract_chunks WHERE chunk_text ILIKE %s ORDER BY readable_id,chunk_id LIMIT %s"""
+            cols, rows = run_sql(sql, (f"%{term}%", limit))
 
         payload = {
             "question": resolved_q,
             "sql": sql,
             "columns": cols,
-            "rows_preview": safe_json(rows[:50]),
+            "rows_preview": rows[:50],
             "intent": intent,
             "scope": scope,
             "relevant_history": scope.get("relevant_history", []),
@@ -1431,7 +1731,7 @@ FROM ic.contract_chunks WHERE chunk_text ILIKE '%'||%s||'%' ORDER BY readable_id
                             "title": sec["title"],
                             "sql": sec["sql"],
                             "columns": cols,
-                            "rows_preview": safe_json(rows[:50]),
+                            "rows_preview": rows[:50],
                             "row_count_returned": len(rows),
                             "metric": {
                                 "name": metric_name,
@@ -1490,8 +1790,8 @@ FROM ic.contract_chunks WHERE chunk_text ILIKE '%'||%s||'%' ORDER BY readable_id
         single_sql = sections[0]["sql"] if sections else sql
         cols, rows = run_sql(single_sql, params)
 
-        print("DEBUG: SINGLE SQL:", single_sql)
-        print("DEBUG: PARAMS:", params)
+        log.debug("SINGLE SQL: %s", single_sql)
+        log.debug("PARAMS: %s", params)
     
 
         # Build exec-brief with prior anchor (if follow-up)
@@ -1515,7 +1815,7 @@ FROM ic.contract_chunks WHERE chunk_text ILIKE '%'||%s||'%' ORDER BY readable_id
             "question": resolved_q,
             "sql": single_sql,
             "columns": cols,
-            "rows_preview": safe_json(rows[:50]),
+            "rows_preview": rows[:50],
             "row_count_returned": len(rows),
             "has_rows": len(rows) > 0,
             "true_numeric_result": numeric_value,
@@ -1525,15 +1825,7 @@ FROM ic.contract_chunks WHERE chunk_text ILIKE '%'||%s||'%' ORDER BY readable_id
             "relevant_history": scope.get("relevant_history", []),
             "primary_response": primary_response if is_followup_turn else None
         }
-        stream = client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0,
-            messages=[
-                {"role": "system", "content": build_general_summarizer_prompt()},
-                {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-            ],
-            stream=True,
-        )
+        stream = stream_general_from_payload(payload)
 
 
         if numeric_value is not None:
@@ -1547,31 +1839,22 @@ FROM ic.contract_chunks WHERE chunk_text ILIKE '%'||%s||'%' ORDER BY readable_id
             # detect a simple grouped result: one text-like column + one numeric-like column
             # this lets us remember category labels like "counterparties", "internal", etc.
             try:
-                text_col_idx = None
-                for ci, cname in enumerate(cols):
-                    if any(isinstance(r[ci], str) and r[ci].strip() for r in rows if r is not None):
-                        text_col_idx = ci
-                        break
-
-                num_col_idx = None
-                for ci, cname in enumerate(cols):
-                    if any(isinstance(r[ci], (int, float, Decimal)) for r in rows if r is not None):
-                        num_col_idx = ci
-                        break
+                # transpose once; each scan then walks one contiguous column
+                columns = list(zip(*rows))
+                text_col_idx = next((ci for ci, col in enumerate(columns)
+                                     if any(isinstance(v, str) and v.strip() for v in col)), None)
+                num_col_idx = next((ci for ci, col in enumerate(columns)
+                                    if any(isinstance(v, NUMERIC_TYPES) for v in col)), None)
 
                 if text_col_idx is not None and num_col_idx is not None and text_col_idx != num_col_idx:
-                    labels = []
-                    for r in rows:
-                        v = r[text_col_idx]
-                        if isinstance(v, str) and v.strip():
-                            labels.append(v.strip())
+                    labels = [v.strip() for v in columns[text_col_idx] if isinstance(v, str) and v.strip()]
                     if labels:
                         new_primary = {
                             "type": "grouped",
                             "context": resolved_q,
                             "group_col": cols[text_col_idx],
                             "value_col": cols[num_col_idx],
-                            "labels": [l.lower() for l in labels][:100]
+                            "labels": [l.lower() for l in labels[:100]]
                         }
             except Exception:
                 pass
@@ -1579,12 +1862,8 @@ FROM ic.contract_chunks WHERE chunk_text ILIKE '%'||%s||'%' ORDER BY readable_id
         return {
             "sql": single_sql,
             "columns": cols,
-            "rows": safe_json(rows),
-            "stream": (
-                chunk.choices[0].delta.content
-                for chunk in stream
-                if chunk.choices and chunk.choices[0].delta.content
-            ),
+            "rows": rows,
+            "stream": stream,
             "intent_json": intent,
             "conversation_summary": updated_summary,
             "scope": scope,
@@ -1594,7 +1873,7 @@ FROM ic.contract_chunks WHERE chunk_text ILIKE '%'||%s||'%' ORDER BY readable_id
 
     except Exception as e:
         # Error → Exec-brief the error cleanly
-        print("DEBUG SQL EXCEPTION:", repr(e))
+        log.debug("SQL EXCEPTION: %s", repr(e))
         payload = {
             "question": resolved_q,
             "sql": sql if "sql" in locals() else "",
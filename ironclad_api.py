@@ -17,16 +17,23 @@ USER_EMAIL = os.getenv("IRONCLAD_USER_EMAIL")  # for impersonation with client-c
 API_SLEEP = float(os.getenv("IRONCLAD_API_SLEEP", "0.15"))
 
 
+_headers_cache: Tuple[str | None, Dict[str, str]] = (None, {})  # (token, headers)
+
+
 def _headers() -> Dict[str, str]:
+    """Shared header dict, rebuilt only when the token rotates. Callers must not mutate it."""
+    global _headers_cache
     token = get_access_token()
-    h = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/json",
-    }
-    # x-as-user-email is required for some endpoints
-    if USER_EMAIL:
-        h["x-as-user-email"] = USER_EMAIL
-    return h
+    if _headers_cache[0] != token:
+        h = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+        }
+        # x-as-user-email is required for some endpoints
+        if USER_EMAIL:
+            h["x-as-user-email"] = USER_EMAIL
+        _headers_cache = (token, h)
+    return _headers_cache[1]
 
 
 def _get(path: str, params: dict | None = None, max_retries: int = 3) -> Any:
@@ -1,5 +1,6 @@
 # load_imported_workflows.py
-import os, json
+import os
+import orjson
 from pathlib import Path
 from db import get_conn
 
@@ -69,7 +70,7 @@ def upsert_imported(cur, rec: dict):
         wf_id, readable_id, title, record_type,
         counterparty, department, legal_entity, owner_name,
         agreement_date, execution_date, expiration_date,
-        json.dumps(merged_attrs), json.dumps({}), json.dumps(rec),
+        orjson.dumps(merged_attrs).decode(), "{}", orjson.dumps(rec).decode(),
         contract_value_amount, contract_value_currency,
         last_updated_at
     ))
@@ -85,7 +86,7 @@ def upsert_imported(cur, rec: dict):
                     INSERT INTO ic.clauses (workflow_id, clause_name, clause_value)
                     VALUES (%s,%s,%s)
                     ON CONFLICT DO NOTHING
-                """, (wf_id, clause_name, json.dumps(clause_val)))
+                """, (wf_id, clause_name, orjson.dumps(clause_val).decode()))
 
         # --- Insert attachments metadata into ic.documents (auto id, no collisions) ---
     attachments = rec.get("attachments", {})
@@ -119,7 +120,7 @@ def main():
     with get_conn() as conn, conn.cursor() as cur:
         count = 0
         for path in RAW_DIR.glob("*.json"):
-            data = json.loads(path.read_text())
+            data = orjson.loads(path.read_bytes())
             if data.get("source", {}).get("type") == "import_project":
                 upsert_imported(cur, data)
                 print(f"✔ loaded imported {data.get('ironcladId')}")
@@ -2187,16 +2187,16 @@ Table: contract_texts
 Table: contract_chunks
 - readable_id (TEXT)
 - workflow_id (TEXT, nullable)
-- chunk_id (BIGINT)                -- 0..N-1 per document
+- chunk_id (INT)                   -- 0..N-1 per document; PK (readable_id, chunk_id)
 - start_char (INT)
 - end_char (INT)
 - chunk_text (TEXT)
-- embedding (vector(1536))         -- pgvector (cosine)
+- embedding (halfvec(1536))        -- pgvector (cosine), FP16
 - text_sha256 (TEXT)
 
 Indexes
 - GIN trigram over chunk_text for fast ILIKE '%term%' search.
-- IVFFLAT vector_cosine_ops over embedding for semantic retrieval.
+- HNSW halfvec_cosine_ops over embedding for semantic retrieval.
 
 Deterministic patterns (counts from text)
 - Count contracts that mention a term:
@@ -2232,9 +2232,9 @@ Semantic patterns (pgvector)
 - Query embedding → nearest chunks, then group by readable_id:
     WITH top_chunks AS (
       SELECT readable_id, chunk_id, chunk_text,
-             (embedding <=> '<[dims floats]>'::vector) AS cosine_distance
+             (embedding <=> '<[dims floats]>'::halfvec) AS cosine_distance
       FROM ic.contract_chunks
-      ORDER BY embedding <=> '<[dims floats]>'::vector
+      ORDER BY embedding <=> '<[dims floats]>'::halfvec
       LIMIT 40
     )
     SELECT readable_id,
@@ -19,8 +19,10 @@ def _headers():
         h["x-as-user-email"] = USER_EMAIL
     return h
 
+UNSAFE_FILENAME_RE = re.compile(r'[<>:"/\\|?*]')
+
 def safe_filename(ic_number: str, orig_name: str, source_tag: str) -> str:
-    orig = re.sub(r'[<>:"/\\|?*]', "_", orig_name)
+    orig = UNSAFE_FILENAME_RE.sub("_", orig_name)
     return f"{ic_number}_{source_tag} - {orig[:100]}"
 
 def main():